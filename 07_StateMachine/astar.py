@@ -1,5 +1,8 @@
+import heapq
 import math
 
+from occupancy_grid import MASK_DIRECTIONS, NEIGHBOR_OFFSETS, OccupancyGrid
+
 
 def heuristic(start, goal, strategy):
     match strategy:
@@ -21,68 +24,266 @@ def reconstruct_path(came_from, current):
 
 
 def get_neighbors(node, grid):
+    if isinstance(grid, OccupancyGrid):
+        return grid.neighbors(node)
+    # a nested list, look the 8 cells up directly rather than building a whole grid
+    height, width = len(grid), len(grid[0])
     neighbors = []
-    is_at_left_edge = node[0] == 0
-    is_at_right_edge = node[0] == len(grid[0]) - 1
-    is_at_top_edge = node[1] == 0
-    is_at_bottom_edge = node[1] == len(grid) - 1
-
-    if not is_at_left_edge:  # east
-        neighbors.append((node[0] - 1, node[1]))
-        if not is_at_top_edge:  # northeast
-            neighbors.append((node[0] - 1, node[1] - 1))
-        if not is_at_bottom_edge:  # southeast
-            neighbors.append((node[0] - 1, node[1] + 1))
-    if not is_at_right_edge:  # west
-        neighbors.append((node[0] + 1, node[1]))
-        if not is_at_top_edge:  # northwest
-            neighbors.append((node[0] + 1, node[1] - 1))
-        if not is_at_bottom_edge:  # southwest
-            neighbors.append((node[0] + 1, node[1] + 1))
-    if not is_at_top_edge:  # north
-        neighbors.append((node[0], node[1] - 1))
-    if not is_at_bottom_edge:  # south
-        neighbors.append((node[0], node[1] + 1))
-    return list(filter(lambda node: grid[node[1]][node[0]] == 0, neighbors))
+    for dx, dy in NEIGHBOR_OFFSETS:
+        x, y = node[0] + dx, node[1] + dy
+        if 0 <= x < width and 0 <= y < height and grid[y][x] == 0:
+            neighbors.append((x, y))
+    return neighbors
 
 
 def distance(a, b, strategy):
     return heuristic(a, b, strategy)
 
 
-def a_star(start, goal, grid, strategy="manhattan"):
-    open_nodes = [start]  # priority queue ordered by min_f
-    closed_nodes = []
+def node_heuristic(goal, grid, strategy):
+    # heuristic() on flat node ids, without building a tuple per call
+    goal_x, goal_y = goal
+    stride = grid.stride
+
+    match strategy:
+        case "manhattan":
+
+            def h(node_id):
+                y, x = divmod(node_id, stride)
+                return abs(x - 1 - goal_x) + abs(y - 1 - goal_y)
+
+        case "euclidian":
+
+            def h(node_id):
+                y, x = divmod(node_id, stride)
+                return math.sqrt((x - 1 - goal_x) ** 2 + (y - 1 - goal_y) ** 2)
+
+        case _:
+
+            def h(_node_id):
+                return 0
+
+    return h
+
+
+def a_star(
+    start,
+    goal,
+    grid,
+    strategy="manhattan",
+    algorithm="astar",
+    stats=None,
+    cost_map=None,
+):
+    """
+    Pass a PlannerStats as stats to have the search counted and timed.
+    Pass a CostMap as cost_map to scale each step by the cost of the cell it
+    enters (inflated cells can't be entered at all). JPS needs uniform costs
+    so it can't be combined with a cost map.
+    """
+    grid = OccupancyGrid.from_grid(grid)
+    match algorithm:
+        case "astar":
+            search = best_first_search
+        case "jps":
+            if cost_map is not None:
+                raise ValueError(
+                    "jps only works on uniform-cost grids, drop the cost map"
+                )
+            search = jump_point_search
+        case _:
+            raise ValueError(f"unknown algorithm {algorithm!r}")
+    extra = {"cost_map": cost_map} if cost_map is not None else {}
+    if stats is None:
+        return search(start, goal, grid, strategy, **extra)
+    with stats.timed():
+        return search(start, goal, grid, strategy, stats, **extra)
+
+
+def best_first_search(
+    start, goal, grid, strategy="manhattan", stats=None, cost_map=None
+):
+    grid = OccupancyGrid.from_grid(grid)
+    # costs are all >= 1, so the heuristic stays admissible
+    cell_costs = cost_map.costs() if cost_map is not None else None
+    h_fn = node_heuristic(goal, grid, strategy)
+    step_costs = [distance((0, 0), offset, strategy) for offset in NEIGHBOR_OFFSETS]
+    offsets = grid.offsets
+    neighbor_masks = grid.neighbor_masks
+    start_id = grid.node_id(start)
+    goal_id = grid.node_id(goal)
+    push, pop = heapq.heappush, heapq.heappop
+    if stats is not None:
+        push, h_fn = stats.instrument(push, h_fn)
+
+    # Binary heap of (f, h, node). Ties on f go to the node closest to the goal.
+    # Nodes are never removed from the heap when their score improves, we just
+    # push a new entry and skip the stale one when it comes off (lazy deletion).
+    h = h_fn(start_id)
+    open_heap = [(h, h, start_id)]
+    closed_nodes = set()
+
+    came_from = {}
+    g_score = {start_id: 0}
+
+    try:
+        while open_heap:
+            _f, _h, current = pop(open_heap)
+            if current in closed_nodes:
+                continue  # stale entry
+            if current == goal_id:
+                return [grid.node_at(n) for n in reconstruct_path(came_from, current)]
+
+            closed_nodes.add(current)
+            current_g = g_score[current]
+
+            for k in MASK_DIRECTIONS[neighbor_masks[current]]:
+                neighbor = current + offsets[k]
+                if neighbor in closed_nodes:
+                    continue
+                if cell_costs is None:
+                    tentative_g = current_g + step_costs[k]
+                else:
+                    tentative_g = current_g + step_costs[k] * cell_costs[neighbor]
+                if tentative_g < g_score.get(neighbor, math.inf):
+                    came_from[neighbor] = current
+                    g_score[neighbor] = tentative_g
+                    h = h_fn(neighbor)
+                    push(open_heap, (tentative_g + h, h, neighbor))
+        return False
+    finally:
+        if stats is not None:
+            stats.record_search(open_heap, closed_nodes, g_score)
+
+
+def sign(value):
+    return (value > 0) - (value < 0)
+
+
+def expand_jump_path(jump_points):
+    # Jump points are joined by straight or diagonal runs, fill in every cell
+    # so follow_path still gets one step at a time.
+    path = [jump_points[0]]
+    for end in jump_points[1:]:
+        x, y = path[-1]
+        dx, dy = sign(end[0] - x), sign(end[1] - y)
+        while (x, y) != end:
+            x, y = x + dx, y + dy
+            path.append((x, y))
+    return path
+
+
+def jump_point_search(start, goal, grid, strategy="manhattan", stats=None):
+    """
+    Jump Point Search (Harabor & Grastien 2011) over the same moves as a_star.
+
+    Diagonal moves may cut corners here just like get_neighbors allows, so
+    these are the original forced-neighbour rules. Returns the same kind of
+    full cell-by-cell path as a_star, just with far fewer nodes expanded.
+    """
+    grid = OccupancyGrid.from_grid(grid)
+    h_fn = node_heuristic(goal, grid, strategy)
+    step_costs = {
+        offset: distance((0, 0), offset, strategy) for offset in NEIGHBOR_OFFSETS
+    }
+    passable = grid.passable
+    stride = grid.stride
+    start_id = grid.node_id(start)
+    goal_id = grid.node_id(goal)
+
+    def has_forced_neighbor(node, dx, dy):
+        if dx and dy:
+            return (not passable[node - dx] and passable[node - dx + dy * stride]) or (
+                not passable[node - dy * stride] and passable[node + dx - dy * stride]
+            )
+        if dx:
+            return (not passable[node + stride] and passable[node + dx + stride]) or (
+                not passable[node - stride] and passable[node + dx - stride]
+            )
+        return (not passable[node + 1] and passable[node + 1 + dy * stride]) or (
+            not passable[node - 1] and passable[node - 1 + dy * stride]
+        )
+
+    def jump(node, dx, dy):
+        # Walk from node in direction (dx, dy) until we hit a jump point.
+        # Returns (jump point, number of steps) or None for a dead end.
+        step = dx + dy * stride
+        steps = 0
+        while True:
+            node += step
+            steps += 1
+            if not passable[node]:
+                return None
+            if node == goal_id or has_forced_neighbor(node, dx, dy):
+                return node, steps
+            if dx and dy and (jump(node, dx, 0) or jump(node, 0, dy)):
+                return node, steps
+
+    def pruned_directions(node, parent):
+        if parent is None:
+            return NEIGHBOR_OFFSETS
+        y, x = divmod(node, stride)
+        parent_y, parent_x = divmod(parent, stride)
+        dx, dy = sign(x - parent_x), sign(y - parent_y)
+        if dx and dy:
+            directions = [(dx, 0), (0, dy), (dx, dy)]
+            if not passable[node - dx]:
+                directions.append((-dx, dy))
+            if not passable[node - dy * stride]:
+                directions.append((dx, -dy))
+        elif dx:
+            directions = [(dx, 0)]
+            if not passable[node + stride]:
+                directions.append((dx, 1))
+            if not passable[node - stride]:
+                directions.append((dx, -1))
+        else:
+            directions = [(0, dy)]
+            if not passable[node + 1]:
+                directions.append((1, dy))
+            if not passable[node - 1]:
+                directions.append((-1, dy))
+        return directions
+
+    push, pop = heapq.heappush, heapq.heappop
+    if stats is not None:
+        push, h_fn = stats.instrument(push, h_fn)
+
+    h = h_fn(start_id)
+    open_heap = [(h, h, start_id)]
+    closed_nodes = set()
 
     came_from = {}
-    g_score = {}
-    for r, row in enumerate(grid):
-        for c, _ in enumerate(row):
-            g_score[(c, r)] = math.inf
-    g_score[start] = 0
-
-    f_score = {}
-    f_score[start] = heuristic(start, goal, strategy)
-
-    while len(open_nodes) != 0:
-        current = open_nodes[0]
-        if current == goal:
-            return reconstruct_path(came_from, current)
-
-        open_nodes.remove(current)
-        closed_nodes.append(current)
-
-        neighbors = get_neighbors(current, grid)
-
-        for neighbor in neighbors:
-            if neighbor in closed_nodes:
-                continue
-            tentative_g = g_score[current] + distance(current, neighbor, strategy)
-            if tentative_g < g_score[neighbor]:
-                came_from[neighbor] = current
-                g_score[neighbor] = tentative_g
-                f_score[neighbor] = tentative_g + heuristic(neighbor, goal, strategy)
-
-                if neighbor not in open_nodes:
-                    open_nodes.append(neighbor)
-    return False
+    g_score = {start_id: 0}
+
+    try:
+        while open_heap:
+            _f, _h, current = pop(open_heap)
+            if current in closed_nodes:
+                continue  # stale entry
+            if current == goal_id:
+                jump_points = [
+                    grid.node_at(n) for n in reconstruct_path(came_from, current)
+                ]
+                return expand_jump_path(jump_points)
+
+            closed_nodes.add(current)
+            current_g = g_score[current]
+
+            for dx, dy in pruned_directions(current, came_from.get(current)):
+                found = jump(current, dx, dy)
+                if found is None:
+                    continue
+                neighbor, steps = found
+                if neighbor in closed_nodes:
+                    continue
+                tentative_g = current_g + steps * step_costs[(dx, dy)]
+                if tentative_g < g_score.get(neighbor, math.inf):
+                    came_from[neighbor] = current
+                    g_score[neighbor] = tentative_g
+                    h = h_fn(neighbor)
+                    push(open_heap, (tentative_g + h, h, neighbor))
+        return False
+    finally:
+        if stats is not None:
+            stats.record_search(open_heap, closed_nodes, g_score)
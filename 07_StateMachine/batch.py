@@ -0,0 +1,92 @@
+from concurrent.futures import ProcessPoolExecutor
+import math
+from multiprocessing import shared_memory
+import os
+
+import numpy as np
+
+from astar import a_star, distance
+from occupancy_grid import OccupancyGrid
+
+# set up once per worker process by _attach_grid
+_worker = {}
+
+
+def _attach_grid(shm_name, shape, strategy, algorithm):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    cells = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+    _worker["shm"] = shm  # keep the mapping alive for the life of the worker
+    _worker["grid"] = OccupancyGrid(cells)
+    _worker["strategy"] = strategy
+    _worker["algorithm"] = algorithm
+
+
+def _run_queries(pairs, return_paths):
+    """
+    pairs: int array of shape (n, 4), rows of start_x, start_y, goal_x, goal_y.
+    Returns (costs, path lengths in cells, flat path cells) for the chunk.
+    """
+    grid = _worker["grid"]
+    strategy = _worker["strategy"]
+    algorithm = _worker["algorithm"]
+    costs = np.full(len(pairs), math.inf)
+    counts = np.zeros(len(pairs), dtype=np.int64)
+    cells = []
+    for i, (sx, sy, gx, gy) in enumerate(pairs.tolist()):
+        path = a_star((sx, sy), (gx, gy), grid, strategy, algorithm)
+        if not path:
+            continue
+        costs[i] = sum(distance(a, b, strategy) for a, b in zip(path, path[1:]))
+        if return_paths:
+            counts[i] = len(path)
+            cells.extend(path)
+    return costs, counts, np.array(cells, dtype=np.int32).reshape(-1, 2)
+
+
+def a_star_batch(
+    grid,
+    pairs,
+    workers=None,
+    return_paths=False,
+    strategy="manhattan",
+    algorithm="astar",
+    chunk_size=256,
+):
+    """
+    Run many (start, goal) queries over one grid on a process pool.
+
+    The grid goes to the workers once through shared memory rather than
+    being pickled with every task. Returns (costs, paths): costs is a float
+    array with inf where there's no path. paths is None unless return_paths,
+    in which case it's (offsets, cells): the path for query i is
+    cells[offsets[i]:offsets[i + 1]] as (x, y) rows, empty if unreachable.
+    """
+    cells = np.ascontiguousarray(OccupancyGrid.from_grid(grid).cells)
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 4)
+    chunks = [pairs[i : i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+    workers = workers or os.cpu_count()
+
+    shm = shared_memory.SharedMemory(create=True, size=max(cells.nbytes, 1))
+    try:
+        np.ndarray(cells.shape, dtype=np.uint8, buffer=shm.buf)[...] = cells
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_attach_grid,
+            initargs=(shm.name, cells.shape, strategy, algorithm),
+        ) as pool:
+            results = list(pool.map(_run_queries, chunks, [return_paths] * len(chunks)))
+    finally:
+        shm.close()
+        shm.unlink()
+
+    if not results:
+        results = [
+            (np.empty(0), np.empty(0, dtype=np.int64), np.empty((0, 2), dtype=np.int32))
+        ]
+    costs = np.concatenate([r[0] for r in results])
+    if not return_paths:
+        return costs, None
+    counts = np.concatenate([r[1] for r in results])
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return costs, (offsets, np.concatenate([r[2] for r in results]))
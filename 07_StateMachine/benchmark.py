@@ -0,0 +1,319 @@
+"""
+Pathfinding benchmarks.
+
+    python benchmark.py                   # default sizes, all kinds and planners
+    python benchmark.py --sizes 64 256 --planners astar jps
+    python benchmark.py --sizes 2048 --planners astar jps hpa --queries 5
+    python benchmark.py --output new.json --compare old.json
+
+Every planner and heuristic runs the same seeded queries on the same seeded
+grids, so two result files from different commits can be compared directly.
+"""
+
+import argparse
+from datetime import datetime
+import json
+import math
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+
+from astar import a_star
+from dstar_lite import DStarLite
+from flow_field import FlowField
+from hpa import HierarchicalPlanner
+from occupancy_grid import OccupancyGrid
+from planner_stats import PlannerStats
+
+STRATEGIES = ("manhattan", "euclidian")
+GRID_KINDS = ("random", "maze", "rooms")
+PLANNERS = ("astar", "jps", "flow_field", "hpa", "dstar_lite")
+
+
+def random_grid(size, density, seed=0):
+    rng = random.Random(seed)
+    grid = [
+        [1 if rng.random() < density else 0 for _c in range(size)] for _r in range(size)
+    ]
+    # keep the corners open so there's something to plan between
+    grid[0][0] = 0
+    grid[size - 1][size - 1] = 0
+    return grid
+
+
+def maze_grid(size, seed=0):
+    # depth-first backtracker, passages on odd coordinates
+    rng = random.Random(seed)
+    cells = np.ones((size, size), dtype=np.uint8)
+    cells_per_side = (size - 1) // 2
+    if cells_per_side < 1:
+        return np.zeros((size, size), dtype=np.uint8)
+    visited = np.zeros((cells_per_side, cells_per_side), dtype=bool)
+    stack = [(0, 0)]
+    visited[0, 0] = True
+    cells[1, 1] = 0
+    while stack:
+        cx, cy = stack[-1]
+        options = [
+            (cx + dx, cy + dy)
+            for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1))
+            if 0 <= cx + dx < cells_per_side
+            and 0 <= cy + dy < cells_per_side
+            and not visited[cy + dy, cx + dx]
+        ]
+        if not options:
+            stack.pop()
+            continue
+        nx, ny = rng.choice(options)
+        visited[ny, nx] = True
+        cells[2 * ny + 1, 2 * nx + 1] = 0
+        cells[cy + ny + 1, cx + nx + 1] = 0  # knock out the wall in between
+        stack.append((nx, ny))
+    return cells
+
+
+def rooms_grid(size, seed=0):
+    # square rooms with one-wide walls and a door in every wall segment
+    rng = random.Random(seed)
+    cells = np.zeros((size, size), dtype=np.uint8)
+    room = max(4, size // 8)
+    for wall in range(room, size, room):
+        cells[wall, :] = 1
+        cells[:, wall] = 1
+    for wall in range(room, size, room):
+        for segment in range(0, size, room):
+            low, high = segment + 1, min(segment + room, size) - 1
+            if low <= high:
+                cells[wall, rng.randint(low, high)] = 0
+                cells[rng.randint(low, high), wall] = 0
+    return cells
+
+
+def make_grid(kind, size, seed=0):
+    match kind:
+        case "random":
+            return OccupancyGrid(random_grid(size, 0.2, seed))
+        case "maze":
+            return OccupancyGrid(maze_grid(size, seed))
+        case "rooms":
+            return OccupancyGrid(rooms_grid(size, seed))
+    raise ValueError(f"unknown grid kind {kind!r}")
+
+
+def make_queries(grid, count, seed=0):
+    # only pairs that are connected, unreachable queries just measure a flood fill
+    rng = random.Random(seed)
+    free = grid.free_ids()
+    if len(free) < 2:
+        return []
+    queries = []
+    for _attempt in range(count * 20):
+        start = grid.node_at(int(free[rng.randrange(len(free))]))
+        reachable = grid.components.reachable_ids(start)
+        if len(reachable) < 2:
+            continue
+        goal = grid.node_at(int(reachable[rng.randrange(len(reachable))]))
+        if goal != start:
+            queries.append((start, goal))
+        if len(queries) == count:
+            break
+    return queries
+
+
+def make_planner(name, grid, strategy):
+    """
+    Returns (setup seconds, query function). Setup is whatever a planner can
+    build once per map and reuse across queries. Query functions take an
+    optional PlannerStats, only a_star and flow_field fill it in.
+    """
+    t0 = time.perf_counter()
+    match name:
+        case "astar" | "jps":
+
+            def query(start, goal, stats=None):
+                return a_star(start, goal, grid, strategy, name, stats)
+
+        case "flow_field":
+
+            def query(start, goal, stats=None):
+                return FlowField(grid, goal, strategy, stats=stats).path_from(start)
+
+        case "hpa":
+            planner = HierarchicalPlanner(grid, 16, strategy)
+
+            def query(start, goal, stats=None):
+                return planner.plan(start, goal)
+
+        case "dstar_lite":
+
+            def query(start, goal, stats=None):
+                return DStarLite(grid, start, goal, strategy).plan()
+
+        case _:
+            raise ValueError(f"unknown planner {name!r}")
+    return time.perf_counter() - t0, query
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+def run_case(kind, size, planner_name, strategy, queries, grid):
+    setup_seconds, query = make_planner(planner_name, grid, strategy)
+    latencies = []
+    solved = 0
+    for start, goal in queries:
+        t0 = time.perf_counter()
+        path = query(start, goal)
+        latencies.append(time.perf_counter() - t0)
+        solved += bool(path)
+
+    # counted in a separate pass so the latencies above are uninstrumented
+    expansions = []
+    if planner_name in ("astar", "jps", "flow_field"):
+        for start, goal in queries:
+            stats = PlannerStats()
+            query(start, goal, stats)
+            expansions.append(stats.expanded)
+
+    # peak memory from one extra traced run, tracing slows everything else down
+    peak_bytes = None
+    if queries:
+        tracemalloc.start()
+        query(*queries[0])
+        _current, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    vertices = size * size
+    p50 = percentile(latencies, 50)
+    return {
+        "kind": kind,
+        "size": size,
+        "planner": planner_name,
+        "strategy": strategy,
+        "queries": len(queries),
+        "solved": solved,
+        "setup_s": setup_seconds,
+        "p50_s": p50,
+        "p90_s": percentile(latencies, 90),
+        "p99_s": percentile(latencies, 99),
+        "max_s": max(latencies) if latencies else None,
+        "expansions_mean": float(np.mean(expansions)) if expansions else None,
+        "peak_bytes": peak_bytes,
+        # should stay roughly flat as grids grow if a planner is O(E log V)
+        "p50_us_per_elogv": (
+            p50 * 1e6 / (8 * vertices * math.log2(vertices))
+            if p50 and vertices > 1
+            else None
+        ),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_row(row):
+    def ms(seconds):
+        return f"{seconds * 1000:9.2f}" if seconds is not None else f"{'-':>9}"
+
+    peak = (
+        f"{row['peak_bytes'] / 1024:9.0f}"
+        if row["peak_bytes"] is not None
+        else f"{'-':>9}"
+    )
+    expanded = (
+        f"{row['expansions_mean']:9.0f}"
+        if row["expansions_mean"] is not None
+        else f"{'-':>9}"
+    )
+    print(
+        f"{row['kind']:>6} {row['size']:>5} {row['planner']:>10} {row['strategy']:>9} "
+        f"{row['solved']:>3}/{row['queries']:<3} {ms(row['setup_s'])} "
+        f"{ms(row['p50_s'])} {ms(row['p90_s'])} {ms(row['p99_s'])} {expanded} {peak}"
+    )
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    def key(row):
+        return (row["kind"], row["size"], row["planner"], row["strategy"])
+
+    old = {key(row): row for row in baseline["results"]}
+    print(f"\np50 vs {baseline_path} ({baseline.get('revision')})")
+    for row in results:
+        before = old.get(key(row))
+        if not before or not before["p50_s"] or not row["p50_s"]:
+            continue
+        ratio = row["p50_s"] / before["p50_s"]
+        flag = "  <-- slower" if ratio > 1.2 else ""
+        print(f"{' '.join(str(k) for k in key(row)):>40}  x{ratio:5.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pathfinding benchmark suite")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[8, 32, 128, 512])
+    parser.add_argument(
+        "--kinds", nargs="+", default=list(GRID_KINDS), choices=GRID_KINDS
+    )
+    parser.add_argument(
+        "--planners", nargs="+", default=list(PLANNERS), choices=PLANNERS
+    )
+    parser.add_argument(
+        "--strategies", nargs="+", default=list(STRATEGIES), choices=STRATEGIES
+    )
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument(
+        "--compare", help="earlier results file to compare p50 latency against"
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'kind':>6} {'size':>5} {'planner':>10} {'strategy':>9} {'ok':>7} "
+        f"{'setup ms':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} "
+        f"{'expanded':>9} {'peak KiB':>9}"
+    )
+    results = []
+    for kind in args.kinds:
+        for size in args.sizes:
+            grid = make_grid(kind, size, args.seed)
+            queries = make_queries(grid, args.queries, args.seed)
+            for planner_name in args.planners:
+                for strategy in args.strategies:
+                    row = run_case(kind, size, planner_name, strategy, queries, grid)
+                    print_row(row)
+                    results.append(row)
+
+    report = {
+        "revision": git_revision(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "seed": args.seed,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nwrote {len(results)} results to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
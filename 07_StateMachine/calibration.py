@@ -0,0 +1,213 @@
+"""
+Motion calibration.
+
+Rolling time to distance drifts with battery level, floor surface and the
+individual robot, so instead of hand-tuned constants we fit
+
+    cells = gain * speed * (seconds - spin_up)
+
+to a handful of measured test drives. The fit is saved per robot and loaded
+at startup by grid_utils.
+
+    python calibration.py            # calibrate the robot in constants.TOY_NAME
+    python calibration.py SB-1234 --cell-size 25
+"""
+
+import argparse
+import asyncio
+from datetime import datetime
+import json
+import math
+import os
+
+import numpy as np
+
+from constants import CELL_SIZE_CM, TOY_NAME
+
+CALIBRATION_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "calibration"
+)
+
+# what magical numbers, only used until a robot has been calibrated
+FIRST_CELL_SECONDS = 0.62  # time at speed 80 to cover the first cell from a standstill
+MOMENTUM_FACTOR = 0.55  # once rolling, each extra cell takes this fraction of that
+REFERENCE_SPEED = 80
+# The default model matches these exactly for straight cells. Diagonals used
+# their own hand-tuned 0.83 s first step; the model scales with length
+# instead, so a first diagonal step is 0.761 s and a rolling one 0.482 s,
+# not 0.83 s and 0.4565 s.
+
+TEST_SPEEDS = (60, 80, 120)
+TEST_DURATIONS = (0.5, 1.0, 1.5, 2.0)
+
+
+class MotionModel:
+    """
+    cells = gain * speed * (seconds - spin_up)
+
+    gain is cells per second per unit of speed once the robot is rolling and
+    spin_up is the time lost getting going from a standstill.
+    """
+
+    def __init__(self, gain, spin_up, samples=None):
+        self.gain = gain
+        self.spin_up = spin_up
+        self.samples = samples or []
+
+    @classmethod
+    def default(cls):
+        # reproduces the old hand-tuned timings at REFERENCE_SPEED, see above for
+        # diagonals
+        cruise = FIRST_CELL_SECONDS * MOMENTUM_FACTOR
+        return cls(1 / (REFERENCE_SPEED * cruise), FIRST_CELL_SECONDS - cruise)
+
+    @classmethod
+    def fit(cls, samples):
+        """
+        samples are (speed, seconds, cells) tuples. Least squares on
+        cells = gain * speed * seconds - gain * spin_up * speed, which is
+        linear in (gain, gain * spin_up).
+        """
+        if len(samples) < 2:
+            raise ValueError("need at least two samples to fit a motion model")
+        data = np.asarray(samples, dtype=float)
+        speed, seconds, cells = data[:, 0], data[:, 1], data[:, 2]
+        features = np.column_stack([speed * seconds, -speed])
+        (gain, lost), *_ = np.linalg.lstsq(features, cells, rcond=None)
+        if gain <= 0:
+            raise ValueError(
+                "robot didn't move further the longer it rolled, bad samples?"
+            )
+        return cls(
+            float(gain), max(0.0, float(lost / gain)), [list(s) for s in samples]
+        )
+
+    def cells_per_second(self, speed):
+        return self.gain * speed
+
+    def distance(self, speed, seconds):
+        return max(0.0, self.gain * speed * (seconds - self.spin_up))
+
+    def duration(self, length, speed, rolling=False):
+        """
+        Seconds to roll at speed to cover `length` cells in a straight line.
+        If the robot is already rolling there's no spin-up on the first cell.
+        """
+        cruise = 1 / self.cells_per_second(speed)
+        if rolling:
+            return length * cruise
+        if length <= 1:
+            return (self.spin_up + cruise) * length
+        return self.spin_up + length * cruise
+
+    def residuals(self):
+        return [
+            cells - self.distance(speed, seconds)
+            for speed, seconds, cells in self.samples
+        ]
+
+    def to_dict(self):
+        return {"gain": self.gain, "spin_up": self.spin_up, "samples": self.samples}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["gain"], data["spin_up"], data.get("samples"))
+
+
+def calibration_path(toy_name):
+    return os.path.join(CALIBRATION_DIR, f"{toy_name}.json")
+
+
+def save_motion_model(toy_name, model, cell_size=CELL_SIZE_CM):
+    os.makedirs(CALIBRATION_DIR, exist_ok=True)
+    data = model.to_dict()
+    data["toy"] = toy_name
+    data["cell_size_cm"] = cell_size
+    data["created"] = datetime.now().isoformat(timespec="seconds")
+    with open(calibration_path(toy_name), "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def load_motion_model(toy_name):
+    """
+    Returns the saved model for toy_name, or the default one if it hasn't
+    been calibrated yet (or the file is unreadable).
+    """
+    try:
+        with open(calibration_path(toy_name)) as f:
+            return MotionModel.from_dict(json.load(f))
+    except FileNotFoundError:
+        return MotionModel.default()
+    except (OSError, ValueError, KeyError) as e:
+        print("couldn't read calibration for", toy_name, e, "- using defaults")
+        return MotionModel.default()
+
+
+def location_measure(sphero, cell_size=CELL_SIZE_CM):
+    """
+    Default measure, the robot's own dead reckoning. Anything else that
+    returns the robot's position in cells (e.g. the overhead ArUco tracker)
+    can be passed to calibrate instead.
+    """
+
+    def measure():
+        location = sphero.get_location()
+        return location["x"] / cell_size, location["y"] / cell_size
+
+    return measure
+
+
+async def calibrate(
+    sphero, speeds=TEST_SPEEDS, durations=TEST_DURATIONS, measure=None, settle=1.0
+):
+    """
+    Drives one straight test segment per (speed, duration), going back and
+    forth so the robot stays roughly where it started, and fits a model to
+    the distances covered.
+    """
+    measure = measure or location_measure(sphero)
+    samples = []
+    heading = 0
+    for speed in speeds:
+        for seconds in durations:
+            before = measure()
+            sphero.set_heading(heading)
+            sphero.set_speed(speed)
+            await asyncio.sleep(seconds)
+            sphero.set_speed(0)
+            # let it coast to a stop, that's part of the segment too
+            await asyncio.sleep(settle)
+            cells = math.dist(before, measure())
+            print(f"speed {speed:>3} for {seconds:.2f}s: {cells:.2f} cells")
+            samples.append((speed, seconds, cells))
+            heading = (heading + 180) % 360
+    return MotionModel.fit(samples)
+
+
+def main():
+    from spherov2 import scanner
+    from spherov2.sphero_edu import SpheroEduAPI
+
+    parser = argparse.ArgumentParser(description="Fit a motion model for one robot")
+    parser.add_argument("toy_name", nargs="?", default=TOY_NAME)
+    parser.add_argument(
+        "--cell-size", type=float, default=CELL_SIZE_CM, help="grid cell in cm"
+    )
+    args = parser.parse_args()
+
+    toy = scanner.find_toy(toy_name=args.toy_name)
+    with SpheroEduAPI(toy) as sphero:
+        model = asyncio.run(
+            calibrate(sphero, measure=location_measure(sphero, args.cell_size))
+        )
+    save_motion_model(args.toy_name, model, args.cell_size)
+    worst = max(abs(r) for r in model.residuals())
+    print(
+        f"gain {model.gain:.5f} cells/s per speed unit, spin-up {model.spin_up:.3f}s, "
+        f"worst residual {worst:.2f} cells"
+    )
+    print("wrote", calibration_path(args.toy_name))
+
+
+if __name__ == "__main__":
+    main()
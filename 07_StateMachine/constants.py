@@ -20,6 +20,22 @@ A_STAR_VIDEO_GRID = [
 
 TINY_TEST_GRID = [[0, 0], [0, 0]]
 
+# "a_star" searches every time, "flow_field" reuses a cached distance field per
+# destination
+PLANNER = "flow_field"
+
+TOY_NAME = "SB-F11F"
+STREAM_INTERVAL = 25  # ms between sensor packets from the toy, spherov2 defaults to 250
+# side of one grid cell on the play mat, used to turn calibration cm into cells
+CELL_SIZE_CM = 30
+
+# set to a file name (e.g. "game.sphlog") to record every sensor sample and
+# event for replay.py
+SENSOR_LOG = None
+
+# grid cells per second, a guess at how fast a hand moves across the table
+PLAYER_SPEED = 2.0
+
 TEAL = Color(0, 225, 75)
 BLACK = Color(0, 0, 0)
 RED = Color(250, 15, 20)
@@ -0,0 +1,174 @@
+import heapq
+import math
+
+import numpy as np
+
+from astar import distance
+from flow_field import FlowField
+from occupancy_grid import MASK_DIRECTIONS, NEIGHBOR_OFFSETS, OccupancyGrid
+
+
+class ReservationTable:
+    """
+    Who is where and when, shared between every robot being planned.
+
+    Cells are reserved per time step. Moves are reserved by their midpoint,
+    which catches both head-on swaps and two diagonals crossing in an X.
+    A robot that has arrived parks on its goal for good.
+    """
+
+    def __init__(self, grid, window=None):
+        self.grid = grid
+        self.window = window  # reservations from this time step on are ignored
+        self.cells = {}  # (cell id, t) -> agent
+        self.moves = {}  # (midpoint, t) -> agent, for the move from t to t + 1
+        self.parked = {}  # cell id -> (time it arrives, agent)
+        self.last_time = {}  # cell id -> latest t it's reserved at
+
+    def _counts(self, t):
+        return self.window is None or t < self.window
+
+    def midpoint(self, a, b):
+        ya, xa = divmod(a, self.grid.stride)
+        yb, xb = divmod(b, self.grid.stride)
+        return (ya + yb, xa + xb)
+
+    def is_blocked(self, cell, t):
+        if not self._counts(t):
+            return False
+        if (cell, t) in self.cells:
+            return True
+        parked = self.parked.get(cell)
+        return parked is not None and t >= parked[0]
+
+    def move_blocked(self, a, b, t):
+        return a != b and self._counts(t) and (self.midpoint(a, b), t) in self.moves
+
+    def can_park(self, cell, t):
+        # nobody else may come through our goal after we've stopped there
+        if cell in self.parked:
+            return False
+        last = self.last_time.get(cell, -1)
+        return last <= t or not self._counts(last)
+
+    def reserve(self, agent, cell_ids):
+        for t, cell in enumerate(cell_ids):
+            self.cells[(cell, t)] = agent
+            self.last_time[cell] = max(self.last_time.get(cell, -1), t)
+        for t, (a, b) in enumerate(zip(cell_ids, cell_ids[1:])):
+            if a != b:
+                self.moves[(self.midpoint(a, b), t)] = agent
+        self.parked[cell_ids[-1]] = (len(cell_ids) - 1, agent)
+
+
+def space_time_a_star(grid, start, goal, table, strategy="manhattan", max_time=None):
+    """
+    A* over (cell, time). Every move or wait takes one time step, waiting
+    costs as much as a straight step. The heuristic is the true distance to
+    the goal ignoring other robots, read off a flow field, so the search
+    only wanders when something is actually in the way.
+    Returns the cell ids for t = 0, 1, 2, ... or False.
+
+    By default the search gives up at the latest reservation, plus as many
+    steps as the unobstructed path has, plus width + height steps to spare
+    for going round and waiting.
+    """
+    goal_id = grid.node_id(goal)
+    if goal_id in table.parked:
+        return False  # somebody else already stops there for good
+    if start == goal and table.can_park(goal_id, 0):
+        return [goal_id]
+    field = FlowField(grid, goal, strategy)
+    padded = np.full(grid.padded.shape, math.inf)
+    padded[1:-1, 1:-1] = field.distances
+    h = padded.ravel().tolist()
+
+    step_costs = [distance((0, 0), offset, strategy) for offset in NEIGHBOR_OFFSETS]
+    wait_cost = distance((0, 0), (1, 0), strategy)
+    offsets = grid.offsets
+    neighbor_masks = grid.neighbor_masks
+    start_id = grid.node_id(start)
+
+    # a blocked start has no distance of its own, it's one step from its neighbours
+    start_h = h[start_id]
+    if start_h == math.inf:
+        start_h = min(
+            (
+                step_costs[k] + h[start_id + offsets[k]]
+                for k in MASK_DIRECTIONS[neighbor_masks[start_id]]
+            ),
+            default=math.inf,
+        )
+    if start_h == math.inf:
+        return False
+    if max_time is None:
+        max_time = (
+            max(table.last_time.values(), default=0)
+            + math.ceil(start_h / min(step_costs))
+            + grid.width
+            + grid.height
+        )
+
+    open_heap = [(start_h, start_h, 0, start_id)]
+    g_score = {(start_id, 0): 0}
+    came_from = {}
+    closed = set()
+    while open_heap:
+        _f, _h, t, current = heapq.heappop(open_heap)
+        state = (current, t)
+        if state in closed:
+            continue
+        closed.add(state)
+        if current == goal_id and table.can_park(goal_id, t):
+            cells = [current]
+            while state in came_from:
+                state = came_from[state]
+                cells.append(state[0])
+            return list(reversed(cells))
+        if t >= max_time:
+            continue
+
+        moves = [
+            (current + offsets[k], step_costs[k])
+            for k in MASK_DIRECTIONS[neighbor_masks[current]]
+        ]
+        if grid.passable[current]:
+            moves.append((current, wait_cost))
+        for neighbor, cost in moves:
+            next_state = (neighbor, t + 1)
+            if next_state in closed or table.is_blocked(neighbor, t + 1):
+                continue
+            if table.move_blocked(current, neighbor, t):
+                continue
+            tentative = g_score[state] + cost
+            if tentative < g_score.get(next_state, math.inf):
+                g_score[next_state] = tentative
+                came_from[next_state] = state
+                heapq.heappush(
+                    open_heap, (tentative + h[neighbor], h[neighbor], t + 1, neighbor)
+                )
+    return False
+
+
+def plan_cooperative(grid, agents, strategy="manhattan", window=None, max_time=None):
+    """
+    Cooperative A* (Silver 2005): plan each robot in turn against a shared
+    reservation table, so later robots route and wait around earlier ones.
+    Cost grows linearly with the number of robots.
+
+    agents is a list of (start, goal). Returns one path per agent, as (x, y)
+    per time step (a repeated cell is a wait), or False where no
+    conflict-free path was found. With a window only the first `window`
+    steps are guaranteed conflict-free (windowed HCA*); replan before then.
+    """
+    grid = OccupancyGrid.from_grid(grid)
+    table = ReservationTable(grid, window)
+    paths = []
+    for agent, (start, goal) in enumerate(agents):
+        cell_ids = space_time_a_star(grid, start, goal, table, strategy, max_time)
+        if not cell_ids:
+            paths.append(False)
+            continue
+        table.reserve(agent, cell_ids)
+        paths.append([grid.node_at(n) for n in cell_ids])
+    return paths
@@ -0,0 +1,114 @@
+import math
+
+import numpy as np
+
+from occupancy_grid import OccupancyGrid
+
+
+class CostMap:
+    """
+    Per-cell traversal costs for an OccupancyGrid that keep the robot off walls.
+
+    A Euclidean distance transform (truncated at penalty_radius, computed with
+    shifted NumPy masks) gives every cell its distance to the nearest
+    obstacle. Cells within robot_radius of one are inflated into obstacles,
+    and cells closer than penalty_radius cost up to 1 + penalty_weight to
+    enter. The edge of the arena counts as a wall.
+
+    Pass to a_star(cost_map=...). After editing the grid, call update_cells()
+    with the changed cells to recompute just the area around them; if the
+    grid changed without that, the whole map is rebuilt on next use.
+    """
+
+    def __init__(self, grid, robot_radius=0.5, penalty_radius=2.0, penalty_weight=2.0):
+        if penalty_radius < robot_radius:
+            raise ValueError("penalty_radius has to be at least robot_radius")
+        self.grid = OccupancyGrid.from_grid(grid)
+        self.robot_radius = robot_radius
+        self.penalty_radius = penalty_radius
+        self.penalty_weight = penalty_weight
+        self.reach = math.ceil(penalty_radius)
+        reach = self.reach
+        self.kernel = [
+            (dx, dy, dx * dx + dy * dy)
+            for dy in range(-reach, reach + 1)
+            for dx in range(-reach, reach + 1)
+            if dx * dx + dy * dy <= penalty_radius**2
+        ]
+        self._rebuild()
+
+    def _rebuild(self):
+        self.distances = np.empty(self.grid.padded.shape)
+        self.cost_array = np.empty(self.grid.padded.shape)
+        self._recompute(0, self.grid.padded.shape[0], 0, self.grid.padded.shape[1])
+        self.cell_costs = self.cost_array.ravel().tolist()
+        self.version = self.grid.version
+
+    def _obstacles(self, y0, y1, x0, x1):
+        # Obstacles in the window grown by reach on every side, anything past
+        # the padded array counting as wall. Only that much gets padded, so a
+        # small update doesn't copy the whole grid.
+        reach = self.reach
+        rows, cols = self.grid.padded.shape
+        top, bottom, left, right = y0 - reach, y1 + reach, x0 - reach, x1 + reach
+        rows_in = slice(max(top, 0), min(bottom, rows))
+        cols_in = slice(max(left, 0), min(right, cols))
+        inside = self.grid.padded[rows_in, cols_in] != 0
+        return np.pad(
+            inside,
+            (
+                (max(-top, 0), max(bottom - rows, 0)),
+                (max(-left, 0), max(right - cols, 0)),
+            ),
+            constant_values=True,
+        )
+
+    def _recompute(self, y0, y1, x0, x1):
+        # window [y0, y1) x [x0, x1) of the padded array
+        reach = self.reach
+        obstacles = self._obstacles(y0, y1, x0, x1)
+        height, width = y1 - y0, x1 - x0
+        dist2 = np.full((height, width), np.inf)
+        for dx, dy, d2 in self.kernel:
+            shifted = obstacles[
+                reach + dy : reach + dy + height, reach + dx : reach + dx + width
+            ]
+            np.minimum(dist2, np.where(shifted, d2, np.inf), out=dist2)
+        dist = np.minimum(np.sqrt(dist2), self.penalty_radius)
+        self.distances[y0:y1, x0:x1] = dist
+
+        band = self.penalty_radius - self.robot_radius
+        if band > 0:
+            closeness = (self.penalty_radius - dist) / band
+        else:
+            closeness = np.zeros_like(dist)
+        costs = 1 + self.penalty_weight * closeness
+        costs[dist <= self.robot_radius] = np.inf  # obstacles and the inflated ring
+        self.cost_array[y0:y1, x0:x1] = costs
+
+    def update_cells(self, cells):
+        if self.grid.version == self.version:
+            return  # nothing changed since we last synced
+        reach = self.reach
+        rows, cols = self.grid.padded.shape
+        for x, y in cells:
+            px, py = x + 1, y + 1
+            y0, y1 = max(py - reach, 0), min(py + reach + 1, rows)
+            x0, x1 = max(px - reach, 0), min(px + reach + 1, cols)
+            self._recompute(y0, y1, x0, x1)
+            # and the planner's flat copy, a row of the window at a time
+            for row in range(y0, y1):
+                costs = self.cost_array[row, x0:x1].tolist()
+                self.cell_costs[row * cols + x0 : row * cols + x1] = costs
+        self.version = self.grid.version
+
+    def costs(self):
+        """
+        Flat traversal cost per padded node id, what the planner reads.
+        """
+        if self.grid.version != self.version:
+            self._rebuild()
+        return self.cell_costs
+
+    def cost(self, node):
+        return self.costs()[self.grid.node_id(node)]
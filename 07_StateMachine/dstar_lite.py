@@ -0,0 +1,157 @@
+import heapq
+import math
+
+import numpy as np
+
+from astar import distance, heuristic
+from occupancy_grid import MASK_DIRECTIONS, NEIGHBOR_OFFSETS, OccupancyGrid
+
+
+class DStarLite:
+    """
+    Incremental planner (D* Lite, Koenig & Likhachev 2002) over an OccupancyGrid.
+
+    Searches backwards from the goal and keeps its g/rhs scores between calls.
+    When cells change, call update_cells() with the cells that changed (after
+    editing the grid) and the next plan() only repairs the part of the search
+    that actually depended on them. Call move_to() as the robot advances.
+    """
+
+    def __init__(self, grid, start, goal, strategy="manhattan"):
+        self.grid = OccupancyGrid.from_grid(grid)
+        self.strategy = strategy
+        self.start = start
+        self.goal = goal
+        self.step_costs = [
+            distance((0, 0), offset, strategy) for offset in NEIGHBOR_OFFSETS
+        ]
+
+        inside = np.zeros(self.grid.padded.shape, dtype=bool)
+        inside[1:-1, 1:-1] = True
+        self.inside = inside.ravel().tolist()
+
+        self.goal_id = self.grid.node_id(goal)
+        self.km = 0
+        self.g = {}
+        self.rhs = {self.goal_id: 0}
+        self.open_keys = {}
+        self.open_heap = []
+        self._push(self.goal_id, self._key(self.goal_id))
+        self.dirty = True
+
+    def _h(self, node_id):
+        # heuristic from the robot to node, which is what D* Lite keys on
+        return heuristic(self.start, self.grid.node_at(node_id), self.strategy)
+
+    def _key(self, node_id):
+        best = min(self.g.get(node_id, math.inf), self.rhs.get(node_id, math.inf))
+        return (best + self._h(node_id) + self.km, best)
+
+    def _push(self, node_id, key):
+        self.open_keys[node_id] = key
+        heapq.heappush(self.open_heap, (key, node_id))
+
+    def _top(self):
+        # drop entries that were removed or re-keyed since they were pushed
+        heap = self.open_heap
+        while heap and self.open_keys.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0] if heap else ((math.inf, math.inf), None)
+
+    def _neighbors(self, node_id):
+        # every in-bounds neighbour, blocked or not
+        return [n for n in (node_id + o for o in self.grid.offsets) if self.inside[n]]
+
+    def _update_vertex(self, node_id):
+        if node_id != self.goal_id:
+            grid = self.grid
+            g = self.g
+            offsets = grid.offsets
+            best = math.inf
+            # c(u, v) is only finite when v is free, which is what the mask holds
+            for k in MASK_DIRECTIONS[grid.neighbor_masks[node_id]]:
+                cost = self.step_costs[k] + g.get(node_id + offsets[k], math.inf)
+                if cost < best:
+                    best = cost
+            self.rhs[node_id] = best
+        self.open_keys.pop(node_id, None)
+        if self.g.get(node_id, math.inf) != self.rhs.get(node_id, math.inf):
+            self._push(node_id, self._key(node_id))
+
+    def _compute_shortest_path(self):
+        start_id = self.grid.node_id(self.start)
+        g = self.g
+        rhs = self.rhs
+        while True:
+            top_key, node_id = self._top()
+            start_rhs = rhs.get(start_id, math.inf)
+            if top_key >= self._key(start_id) and start_rhs == g.get(
+                start_id, math.inf
+            ):
+                break
+            if node_id is None:
+                break
+            new_key = self._key(node_id)
+            if top_key < new_key:
+                self._push(node_id, new_key)
+            elif g.get(node_id, math.inf) > rhs.get(node_id, math.inf):
+                g[node_id] = rhs[node_id]
+                del self.open_keys[node_id]
+                for neighbor in self._neighbors(node_id):
+                    self._update_vertex(neighbor)
+            else:
+                g[node_id] = math.inf
+                self._update_vertex(node_id)
+                for neighbor in self._neighbors(node_id):
+                    self._update_vertex(neighbor)
+
+    def move_to(self, start):
+        if start == self.start:
+            return
+        self.km += heuristic(self.start, start, self.strategy)
+        self.start = start
+        self.dirty = True
+
+    def update_cells(self, cells):
+        """
+        cells: (x, y) cells whose occupancy changed. Only edges into those
+        cells changed cost, so only their neighbours need a new rhs.
+        """
+        grid = self.grid
+        for cell in cells:
+            for neighbor in self._neighbors(grid.node_id(cell)):
+                self._update_vertex(neighbor)
+        self.dirty = True
+
+    def plan(self):
+        """
+        Same result shape as a_star: a list of (x, y) from start to goal, or False.
+        """
+        self._compute_shortest_path()
+        self.dirty = False
+        if self.start == self.goal:
+            return [self.start]
+
+        grid = self.grid
+        g = self.g
+        offsets = grid.offsets
+        node_id = grid.node_id(self.start)
+        if self.rhs.get(node_id, math.inf) == math.inf:
+            return False
+
+        path = [self.start]
+        # g-values along an optimal path strictly decrease, so this ends
+        for _step in range(grid.width * grid.height):
+            if node_id == self.goal_id:
+                return path
+            best = None
+            best_cost = math.inf
+            for k in MASK_DIRECTIONS[grid.neighbor_masks[node_id]]:
+                cost = self.step_costs[k] + g.get(node_id + offsets[k], math.inf)
+                if cost < best_cost:
+                    best, best_cost = node_id + offsets[k], cost
+            if best is None:
+                return False
+            node_id = best
+            path.append(grid.node_at(node_id))
+        return False
@@ -0,0 +1,70 @@
+import asyncio
+from collections import deque
+import math
+
+
+class EventChannel:
+    """
+    Bounded, coalescing delivery of keyed events (collision, landing) to
+    handlers registered once.
+
+    Every key has one preallocated slot, so there are never more pending
+    entries than keys. An event for a key that's already pending is merged
+    into it (count and last time), and one arriving within `window` seconds
+    of the last delivered event for that key is dropped as a duplicate.
+    Neither allocates anything. Handlers run on the loop, in arrival order
+    of the first event of each burst, as handler(key, count, first, last).
+    """
+
+    def __init__(self, keys, window=0.0):
+        self.keys = tuple(keys)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        self.window = window
+        count = len(self.keys)
+        self.handlers = [[] for _ in range(count)]
+        self.pending = [False] * count
+        self.counts = [0] * count
+        self.first = [0.0] * count
+        self.last = [0.0] * count
+        self.delivered = [-math.inf] * count
+        self.dropped = [0] * count
+        self.order = deque(maxlen=count)
+        self.scheduled = False
+
+    def on(self, key, handler):
+        self.handlers[self.index[key]].append(handler)
+
+    def post(self, key, time):
+        """
+        Only call on the loop. Returns False if the event was dropped as a
+        duplicate.
+        """
+        i = self.index[key]
+        if time - self.delivered[i] < self.window:
+            self.dropped[i] += 1
+            return False
+        self.last[i] = time
+        if self.pending[i]:
+            self.counts[i] += 1
+            return True
+        self.pending[i] = True
+        self.counts[i] = 1
+        self.first[i] = time
+        self.order.append(i)
+        if not self.scheduled:
+            # one callback per burst, however many events are in it
+            self.scheduled = True
+            asyncio.get_running_loop().call_soon(self.dispatch)
+        return True
+
+    def dispatch(self):
+        self.scheduled = False
+        while self.order:
+            i = self.order.popleft()
+            self.pending[i] = False
+            self.delivered[i] = self.last[i]
+            for handler in self.handlers[i]:
+                handler(self.keys[i], self.counts[i], self.first[i], self.last[i])
+
+    def stats(self):
+        return {key: self.dropped[i] for i, key in enumerate(self.keys)}
@@ -0,0 +1,233 @@
+"""
+Runs a whole fleet's tag games at once, every robot on the same event loop.
+
+    python fleet.py SB-F11F SB-2A4C SB-7D01            # real toys, by name
+    python fleet.py --simulated 20 --seconds 120       # simulated, random players
+    python fleet.py --simulated 30 --io-workers 2 --report 2
+
+Each robot gets its own Game (states.py), StateMachine and SensorHub, so
+their games don't share anything but the arena and the planners' caches.
+BLE commands go through one bounded IOPool (io_pool.py) instead of
+blocking the loop.
+
+Every --report seconds it prints, per robot, three lags, mean over the
+last few seconds / worst since the last report, in ms:
+
+    timer   how late a sleep on the loop wakes up, the loop itself falling behind
+    sensor  from a sample being read to the states seeing it
+    ble     how long commands queue before the pool gets to send them
+
+Timer lag grows with the number of robots when the loop is the limit, ble
+lag when the pool is.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import sys
+import time
+
+from spherov2 import scanner
+from spherov2.sphero_edu import SpheroEduAPI
+
+from constants import STREAM_INTERVAL
+from io_pool import IOPool
+from main import make_states
+from rolling_stats import RollingWindow
+from sim_sphero import SimulatedSpheroEduAPI, SimulationConfig, find_toy
+from state_machine import StateMachine
+from states import StateName, game_for
+from tag_sessions import RandomPlayer
+
+LAG_WINDOW = 5.0  # seconds the means are over
+
+
+class Lag:
+    def __init__(self, seconds=LAG_WINDOW):
+        self.window = RollingWindow(1024, seconds=seconds)
+        self.worst = 0.0
+
+    def add(self, lag, now):
+        self.window.push(lag, now)
+        self.worst = max(self.worst, lag)
+
+    def format(self, now):
+        self.window.expire(now)
+        text = f"{self.window.mean * 1000:6.1f} /{self.worst * 1000:7.1f}"
+        self.worst = 0.0
+        return text
+
+
+class Robot:
+    """One robot's game, as run by the fleet."""
+
+    def __init__(self, name, sphero, toy=None, player=None, probe_period=0.05):
+        self.name = name
+        self.sphero = sphero  # a PooledSphero
+        self.toy = toy
+        # before the states, so they get this toy's calibration
+        self.game = game_for(sphero, name)
+        self.machine = StateMachine(
+            make_states(sphero), StateName.CHOOSING, StateName.TERMINAL
+        )
+        self.player = player(self.machine) if player is not None else None
+        self.probe_period = probe_period
+        self.timer_lag = Lag()
+        self.sensor_lag = Lag()
+
+    def on_sample(self, name, sample):
+        # the hub stamps samples with time.monotonic when it reads them
+        now = time.monotonic()
+        self.sensor_lag.add(now - sample.time, now)
+
+    async def probe(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            due = loop.time() + self.probe_period
+            await asyncio.sleep(self.probe_period)
+            now = loop.time()
+            self.timer_lag.add(now - due, now)
+
+    async def run(self):
+        hub = self.game.hub
+        if self.toy is not None:
+            hub.attach_stream(self.toy, interval=STREAM_INTERVAL)
+        hub.taps.append(self.on_sample)
+        hub.start()
+        background = [asyncio.create_task(self.probe())]
+        if self.player is not None:
+            background.append(asyncio.create_task(self.player.run()))
+        try:
+            await self.machine.run()
+        finally:
+            for task in background:
+                task.cancel()
+            hub.stop()
+
+    def report(self, now):
+        state = self.machine.current.name.value if self.machine.current else "-"
+        with self.sphero.lock:
+            self.sphero.waits.expire(now)
+            mean, worst = self.sphero.waits.mean, self.sphero.worst_wait
+            ble = f"{mean * 1000:6.1f} /{worst * 1000:7.1f}"
+            self.sphero.worst_wait = 0.0
+            queued = self.sphero.queued
+        return (
+            f"{self.name:10} {state:10} {self.timer_lag.format(now)}  "
+            f"{self.sensor_lag.format(now)}  {ble}  {queued:4}"
+        )
+
+
+def print_report(robots, out):
+    now = time.monotonic()
+    print(
+        f"{'robot':10} {'state':10} {'timer ms':>14}  {'sensor ms':>14}  "
+        f"{'ble ms':>14}  queue",
+        file=out,
+    )
+    for robot in robots:
+        print(robot.report(now), file=out)
+    print(file=out, flush=True)
+
+
+async def report(robots, every, out):
+    while True:
+        await asyncio.sleep(every)
+        print_report(robots, out)
+
+
+async def run_fleet(robots, seconds, every, out):
+    games = {asyncio.create_task(robot.run()): robot for robot in robots}
+    reporter = asyncio.create_task(report(robots, every, out))
+    try:
+        _done, unfinished = await asyncio.wait(games, timeout=seconds)
+    finally:
+        reporter.cancel()
+        for task in games:
+            task.cancel()
+        await asyncio.gather(*games, return_exceptions=True)
+    print_report(robots, out)
+    for task, robot in games.items():
+        if task in unfinished:
+            outcome = "unfinished"
+        elif task.exception() is not None:
+            outcome = f"failed: {task.exception()!r}"
+        else:
+            outcome = {None: "tie", True: "lost", False: "won"}[robot.game.lost]
+        print(f"{robot.name:10} {outcome}", file=out)
+
+
+def simulated_robots(count, pool, latency, seed):
+    robots = []
+    for i in range(count):
+        config = SimulationConfig(latency=latency, seed=seed + i)
+        api = SimulatedSpheroEduAPI(find_toy(f"SB-SIM{i:02}", config))
+        rng = random.Random(seed + i)
+        robots.append(
+            Robot(
+                api.toy.name,
+                pool.robot(api),
+                # the player handles the simulated robot itself, not over BLE
+                player=lambda machine, api=api, rng=rng: RandomPlayer(
+                    api, machine, rng
+                ),
+            )
+        )
+    return robots
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run tag on a fleet of Spheros")
+    parser.add_argument("toys", nargs="*", help="toy names, e.g. SB-F11F")
+    parser.add_argument(
+        "--simulated", type=int, default=0, metavar="N", help="add N simulated robots"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.03, help="simulated BLE latency, s"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--io-workers", type=int, default=4, help="threads sending BLE commands"
+    )
+    parser.add_argument("--seconds", type=float, help="stop the games after this long")
+    parser.add_argument(
+        "--report", type=float, default=5.0, help="seconds between lag reports"
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="show the games' own output"
+    )
+    args = parser.parse_args()
+    if not args.toys and not args.simulated:
+        parser.error("give some toy names or --simulated N")
+
+    out = sys.stdout
+    pool = IOPool(workers=args.io_workers)
+    robots = []
+    with contextlib.ExitStack() as stack:
+        if args.toys:
+            toys = scanner.find_toys(toy_names=args.toys)
+            missing = set(args.toys) - {toy.name for toy in toys}
+            if missing:
+                print("not found:", ", ".join(sorted(missing)), file=out)
+            # one at a time, adapters don't like connecting to several at once
+            for toy in toys:
+                api = stack.enter_context(SpheroEduAPI(toy))
+                robots.append(Robot(toy.name, pool.robot(api), toy=toy))
+        robots += simulated_robots(args.simulated, pool, args.latency, args.seed)
+        # before disconnecting, so the last commands (stop!) still go out
+        stack.callback(pool.shutdown)
+
+        if not args.verbose:
+            # thirty robots' worth of "entering EVADE" drowns the reports
+            devnull = stack.enter_context(open(os.devnull, "w"))
+            stack.enter_context(contextlib.redirect_stdout(devnull))
+        try:
+            asyncio.run(run_fleet(robots, args.seconds, args.report, out))
+        except KeyboardInterrupt:
+            print("KeyboardInterrupt received, exiting...", file=out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+from collections import OrderedDict
+import math
+
+import numpy as np
+
+from astar import distance
+from occupancy_grid import NEIGHBOR_OFFSETS, OccupancyGrid
+
+
+def neighbor_views(padded, height, width):
+    # For each direction, a view of the padded array lined up so that
+    # view[y, x] is the value of that neighbour of interior cell (x, y).
+    return [
+        padded[1 + dy : height + 1 + dy, 1 + dx : width + 1 + dx]
+        for dx, dy in NEIGHBOR_OFFSETS
+    ]
+
+
+class FlowField:
+    """
+    Distance to one goal from every cell, plus the direction of the next step.
+
+    Built with a vectorised wavefront out from the goal that settles a band
+    of cells at a time, so it's about one pass over the grid rather than
+    one per step of the longest path.
+    Once built, a path from any start is just following next-step pointers.
+    With a CostMap, each step is scaled by the cost of the cell it enters,
+    same as a_star. Pass a PlannerStats as stats to have the build counted.
+    """
+
+    def __init__(self, grid, goal, strategy="manhattan", cost_map=None, stats=None):
+        self.grid = OccupancyGrid.from_grid(grid)
+        self.goal = goal
+        self.strategy = strategy
+        self.cost_map = cost_map
+        self.version = self.grid.version
+        self.step_costs = [
+            distance((0, 0), offset, strategy) for offset in NEIGHBOR_OFFSETS
+        ]
+        if min(self.step_costs) <= 0:
+            raise ValueError(
+                f"flow fields need positive step costs, got strategy {strategy!r}"
+            )
+        self._build(stats)
+
+    def _build(self, stats=None):
+        grid = self.grid
+        height, width = grid.shape
+        offsets = np.array(grid.offsets)
+        step_costs = np.array(self.step_costs, dtype=float)
+        free = grid.free_mask.ravel()
+        if self.cost_map is None:
+            cell_costs = np.ones(free.shape)
+        else:
+            self.cost_map.costs()  # brings it up to date with the grid
+            cell_costs = self.cost_map.cost_array.ravel()
+
+        flat = np.full(free.shape, math.inf)
+        pending = np.zeros(0, dtype=np.intp)
+        if grid.is_free(self.goal):
+            goal_id = grid.node_id(self.goal)
+            flat[goal_id] = 0
+            pending = np.array([goal_id])
+        # Wavefront out from the goal, a band of distances at a time: only the
+        # pending cells within `band` of the nearest one have their neighbours
+        # relaxed. Were the band as wide as the cheapest step (Dial's
+        # algorithm) each cell would be final when reached. A few steps wide
+        # means far fewer rounds down long corridors, at the price of a cell
+        # now and then improving again, which just puts it back in pending.
+        # Stepping onto a cell costs the step times the cost of the cell
+        # entered. The blocked ring around the padded grid keeps ids in range.
+        band = 4 * step_costs.min() * cell_costs[free].min(initial=1.0)
+        expanded = pushed = max_pending = 0
+        while pending.size:
+            max_pending = max(max_pending, pending.size)
+            reached = flat[pending]
+            near = reached < reached.min() + band
+            expanding = pending[near]
+            neighbors = (expanding[:, None] + offsets).ravel()
+            candidates = (
+                flat[expanding, None] + step_costs * cell_costs[expanding, None]
+            ).ravel()
+            better = free[neighbors] & (candidates < flat[neighbors])
+            neighbors = neighbors[better]
+            np.minimum.at(flat, neighbors, candidates[better])
+            pending = np.unique(np.concatenate([pending[~near], neighbors]))
+            expanded += expanding.size
+            pushed += neighbors.size
+        if stats is not None:
+            reached = int(np.count_nonzero(np.isfinite(flat)))
+            stats.record_wavefront(expanded, pushed, reached, max_pending)
+
+        padded = flat.reshape(grid.padded.shape)
+        dist = padded[1:-1, 1:-1]
+        views = neighbor_views(padded, height, width)
+        # cost of stepping from each cell to its neighbour in each direction
+        if self.cost_map is None:
+            step_weights = self.step_costs
+        else:
+            entered = neighbor_views(self.cost_map.cost_array, height, width)
+            step_weights = [cost * cell for cost, cell in zip(self.step_costs, entered)]
+
+        # Next step for every cell, blocked ones included, since a_star lets
+        # the robot start on a blocked cell and step off it.
+        candidates = np.stack(
+            [view + weight for view, weight in zip(views, step_weights)]
+        )
+        next_step = np.argmin(candidates, axis=0).astype(np.int8)
+        next_step[np.isinf(candidates.min(axis=0))] = -1
+
+        self.distances = dist
+        padded_next = np.full(grid.padded.shape, -1, dtype=np.int8)
+        padded_next[1:-1, 1:-1] = next_step
+        self.next_step = padded_next.ravel().tolist()
+
+    def distance_from(self, start):
+        if not self.grid.in_bounds(start):
+            return math.inf
+        return float(self.distances[start[1], start[0]])
+
+    def path_from(self, start):
+        """
+        Same result shape as a_star: a list of (x, y) from start to goal, or False.
+        """
+        if start == self.goal:
+            return [start]
+        if not self.grid.in_bounds(start):
+            return False
+        grid = self.grid
+        offsets = grid.offsets
+        next_step = self.next_step
+        goal_id = grid.node_id(self.goal)
+
+        node_id = grid.node_id(start)
+        if next_step[node_id] < 0:
+            return False
+        path = [start]
+        while node_id != goal_id:
+            node_id += offsets[next_step[node_id]]
+            path.append(grid.node_at(node_id))
+        return path
+
+
+class FlowFieldCache:
+    """
+    LRU of flow fields for one grid, keyed on (grid version, goal).
+
+    Editing the grid bumps its version, so fields built for the old map are
+    never handed out again.
+    """
+
+    def __init__(self, grid, strategy="manhattan", maxsize=64, cost_map=None):
+        self.grid = OccupancyGrid.from_grid(grid)
+        self.strategy = strategy
+        self.cost_map = cost_map
+        self.maxsize = maxsize
+        self.fields = OrderedDict()
+
+    def get(self, goal, stats=None):
+        """
+        The field for goal, built if it isn't cached. stats (a PlannerStats)
+        only gets counts when it is built, a cached lookup costs nothing.
+        """
+        key = (self.grid.version, goal)
+        field = self.fields.get(key)
+        if field is not None:
+            self.fields.move_to_end(key)
+            return field
+
+        field = FlowField(self.grid, goal, self.strategy, self.cost_map, stats)
+        self.fields[key] = field
+        while len(self.fields) > self.maxsize:
+            self.fields.popitem(last=False)
+        return field
+
+    def path(self, start, goal, stats=None):
+        return self.get(goal, stats).path_from(start)
+
+    def clear(self):
+        self.fields.clear()
@@ -2,20 +2,33 @@ import asyncio
 import math
 import random
 
+import numpy as np
+
+from calibration import load_motion_model
+from constants import TOY_NAME
+from occupancy_grid import OccupancyGrid
+from path_smoothing import collapse_collinear, smooth_path
+
 
 def get_random_destination(grid, current_location):
     """
-    Assumes a grid of NxM as a list of lists. Blockages are represented by 1's.
+    Accepts an OccupancyGrid or an NxM list of lists. Blockages are represented by 1's.
+    Only picks cells reachable from current_location, returns None if there aren't any.
     """
-    result = None
-    num_rows = len(grid) - 1
-    num_cols = len(grid[0]) - 1
-    while result is None:
-        random_y = random.randint(0, num_rows - 1)
-        random_x = random.randint(0, num_cols - 1)
-        if not grid[random_x][random_x] and (random_y, random_x) != current_location:
-            result = (random_x, random_y)
-    return result
+    grid = OccupancyGrid.from_grid(grid)
+    candidates = grid.components.reachable_ids(current_location)
+    current_id = grid.node_id(current_location)
+
+    # candidates is sorted, so skip over our own cell instead of rerolling
+    position = int(np.searchsorted(candidates, current_id))
+    excluded = bool(position < len(candidates) and candidates[position] == current_id)
+    count = len(candidates) - excluded
+    if count == 0:
+        return None
+    index = random.randrange(count)
+    if excluded and index >= position:
+        index += 1
+    return grid.node_at(int(candidates[index]))
 
 
 def get_heading(start, end):
@@ -46,32 +59,304 @@ def get_heading(start, end):
         return degrees + 90
 
 
-async def follow_path(sphero, path):
-    current_location = path[0]
-    step_num = 0
+DRIVE_SPEED = 80
+# see calibration.py, robots can pass their own
+MOTION_MODEL = load_motion_model(TOY_NAME)
+
+
+def segment_duration(length, rolling=False, speed=DRIVE_SPEED, model=None):
+    """
+    Seconds to roll at speed to cover `length` cells in a straight line,
+    from the calibrated motion model unless another one is passed.
+    If the robot is already rolling there's no spin-up on the first cell.
+    """
+    return (model or MOTION_MODEL).duration(length, speed, rolling)
+
+
+class PathExecutor:
+    """
+    Drives a list of waypoints without stopping in between.
+
+    Every segment end is an absolute deadline on the event loop's monotonic
+    clock, so a late wake-up is taken out of the next sleep instead of
+    piling up. The next heading goes out lead_time before the current
+    segment is due to end, which covers the BLE round trip.
+
+    A Sphero turns on the spot, so changing heading by a lot at full speed
+    swings it wide of the line. It sets off only once the first heading has
+    had time to settle at turn_rate, and drops to turn_speed through any
+    turn of more than sharp_turn degrees. The power is cut the model's
+    spin-up time before the end, since the robot coasts on for about as
+    long as it took to get going.
+
+    With a localizer (localization.Localizer) the segments are closed loop:
+    every localizer period the heading is re-aimed at the segment's end from
+    the estimated pose and the deadline is moved to match the distance
+    actually left, up to max_overrun times the segment's planned duration.
+    A segment that runs past that, or bumps into something (a collision on
+    the localizer's hub), or doesn't get any closer for stall_periods
+    periods in a row is given up on: the robot stops and replan is asked
+    where to go from where it is.
+    """
+
+    def __init__(
+        self,
+        sphero,
+        speed=DRIVE_SPEED,
+        lead_time=0.05,
+        model=None,
+        localizer=None,
+        heading_tolerance=5,
+        arrival_tolerance=0.15,
+        sharp_turn=45,
+        turn_rate=360,
+        turn_speed=None,
+        max_overrun=2.0,
+        stall_periods=5,
+    ):
+        self.sphero = sphero
+        self.speed = speed
+        self.lead_time = lead_time
+        self.model = model
+        self.localizer = localizer
+        self.heading_tolerance = heading_tolerance  # degrees
+        self.arrival_tolerance = arrival_tolerance  # cells
+        self.sharp_turn = sharp_turn  # degrees
+        self.turn_rate = turn_rate  # degrees per second, on the spot
+        self.turn_speed = speed // 2 if turn_speed is None else turn_speed
+        self.max_overrun = max_overrun
+        self.stall_periods = stall_periods  # localizer periods
+        self.spin_up = (model or MOTION_MODEL).spin_up
+        # cells per second that still count as getting closer
+        self.min_progress = 0.1 * (model or MOTION_MODEL).cells_per_second(speed)
+        self.heading = None
+        self.set_off_at = -math.inf
+        self.collisions = None
+        self.stalled = False
+
+    async def _sleep_until(self, deadline):
+        delay = deadline - asyncio.get_running_loop().time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _set_heading(self, direction):
+        # sphero drive code chokes on floats, cast to int instead.
+        self.heading = int(direction)
+        self.sphero.set_heading(self.heading)
+
+    def _turn(self, direction):
+        # degrees from where we're pointing, spherov2 remembers the last
+        # heading sent if we haven't sent one yet
+        heading = self.heading
+        if heading is None:
+            heading = self.sphero.get_heading() or 0
+        return abs((direction - heading + 180) % 360 - 180)
+
+    async def _set_off(self, direction):
+        """Turns to direction while stopped, waits for it to settle, rolls."""
+        if direction is not None:
+            turn = self._turn(direction)
+            self._set_heading(direction)
+            await asyncio.sleep(self.lead_time + turn / self.turn_rate)
+        self.sphero.set_speed(self.speed)
+        self.set_off_at = asyncio.get_running_loop().time()
+
+    async def _slow_turn(self, direction):
+        """
+        Turns to direction at turn_speed, back up to speed once the heading
+        has settled. Returns the time lost to it.
+        """
+        turning = self.lead_time + self._turn(direction) / self.turn_rate
+        self._set_heading(direction)
+        self.sphero.set_speed(self.turn_speed)
+        await asyncio.sleep(turning)
+        self.sphero.set_speed(self.speed)
+        return turning * (1 - self.turn_speed / self.speed)
+
+    async def _track(self, target, deadline, lead):
+        """
+        Waits out the segment ending at target, steering at it from the
+        localizer's estimate. Returns the (possibly moved) deadline, sets
+        stalled if it gave up on the segment.
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        give_up = start + self.max_overrun * max(deadline - start, self.spin_up)
+        closest = math.inf
+        periods_stuck = 0
+        while True:
+            now = loop.time()
+            position = self.localizer.position()
+            remaining = math.dist(position, target)
+            if remaining < closest - self.min_progress * self.localizer.period:
+                closest = remaining
+                periods_stuck = 0
+            else:
+                periods_stuck += 1
+            collided = self.collisions.latest is not self.collisions.seen
+            if collided or periods_stuck >= self.stall_periods or now >= give_up:
+                self.collisions.seen = self.collisions.latest
+                self.stalled = True
+                return now
+            if now >= deadline - lead:
+                return deadline
+            direction = get_heading(position, target)
+            if remaining <= self.arrival_tolerance or direction is None:
+                return now
+            error = abs((direction - self.heading + 180) % 360 - 180)
+            if error > 90:
+                return now  # it's behind us, we overshot
+            if error > self.heading_tolerance:
+                self._set_heading(direction)
+            # still getting up to speed if it only just set off
+            spinning_up = max(0.0, self.set_off_at + self.spin_up - now)
+            deadline = min(
+                now
+                + spinning_up
+                + segment_duration(remaining, True, self.speed, self.model),
+                give_up,
+            )
+            await asyncio.sleep(
+                max(0, min(self.localizer.period, deadline - lead - now))
+            )
+
+    async def _wait_for_segment(self, target, deadline, lead):
+        if self.localizer is None:
+            await self._sleep_until(deadline - lead)
+            return deadline
+        return await self._track(target, deadline, lead)
+
+    async def _stop_and_replan(self, replan):
+        """
+        Stops short of a segment we gave up on and, once it's come to a
+        halt, asks replan for a way on from the cell it's in.
+        """
+        self.stalled = False
+        self.sphero.set_speed(0)
+        await asyncio.sleep(self.lead_time + self.spin_up)
+        location = self.localizer.cell()
+        print("stalled, stopping at", location)
+        return replan(location) if replan is not None else None
+
+    def _position(self, waypoint):
+        return self.localizer.position() if self.localizer is not None else waypoint
+
+    async def run(self, waypoints, replan=None):
+        """
+        replan, if given, is called with our location at every waypoint and
+        may return None (carry on), False (stop here) or new waypoints
+        starting from that location. After a stall it's called with the
+        localizer's cell and anything but new waypoints stops there.
+        Returns the waypoint we think we ended up at, or the localizer's
+        cell (where it's coasting to) if there is one.
+        """
+        loop = asyncio.get_running_loop()
+        current_location = waypoints[0]
+        index = 1
+        deadline = loop.time()
+        rolling = False
+        stop_lead = self.lead_time + self.spin_up
+        self.stalled = False
+        if self.localizer is not None:
+            self.collisions = self.localizer.hub.subscribe("collision")
+        try:
+            # once past the last waypoint, around once more to wait out the
+            # final segment
+            while index < len(waypoints) or rolling:
+                target = waypoints[index] if index < len(waypoints) else None
+                if target is not None:
+                    direction = get_heading(current_location, target)
+                    if direction is None:
+                        index += 1
+                        continue
+
+                sharp = False
+                if rolling:
+                    if target is not None:
+                        sharp = self._turn(direction) > self.sharp_turn
+                    deadline = await self._wait_for_segment(
+                        current_location,
+                        deadline,
+                        self.lead_time if target is not None else stop_lead,
+                    )
+                if self.stalled:
+                    rolling = False
+                    new_waypoints = await self._stop_and_replan(replan)
+                    if not new_waypoints:
+                        break
+                    waypoints = new_waypoints
+                    current_location = waypoints[0]
+                    index = 1
+                    continue
+                if target is None:
+                    break
+                position = self._position(current_location)
+                direction = get_heading(position, target)
+                if rolling:
+                    if direction is not None:
+                        if sharp:
+                            deadline += await self._slow_turn(direction)
+                        else:
+                            self._set_heading(direction)
+                else:
+                    await self._set_off(direction)
+                    deadline = loop.time()
+                deadline += segment_duration(
+                    math.dist(position, target), rolling, self.speed, self.model
+                )
+                rolling = True
+
+                current_location = target
+                index += 1
+                if replan is not None:
+                    new_waypoints = replan(current_location)
+                    if new_waypoints is False:
+                        break
+                    if new_waypoints:
+                        waypoints = new_waypoints
+                        index = 1
+        finally:
+            self.sphero.set_speed(0)
+            if self.collisions is not None:
+                self.localizer.hub.unsubscribe(self.collisions)
+                self.collisions = None
+        if self.localizer is not None:
+            return self.localizer.cell(ahead=stop_lead if rolling else 0.0)
+        return current_location
+
+
+async def follow_path(sphero, path, planner=None, localizer=None, pause=2, model=None):
+    """
+    Drive path as one continuous roll: collinear cells are merged and each
+    new heading is sent just before the previous segment ends, so the robot
+    doesn't stop at every corner. Pass the path through
+    path_smoothing.smooth_path first to also get any-angle shortcuts.
+
+    If an incremental planner (DStarLite) is passed, it's told about every
+    waypoint and, if the map changed underneath it, the rest of the route is
+    replanned (and smoothed) from there. With a running localizer the
+    segments are corrected on the fly and the estimated cell is returned.
+    The robot then waits `pause` seconds at the end of the path, pass 0 to
+    carry straight on with the next one. Drive times come from `model`, the
+    robot's own calibration, or MOTION_MODEL if not given.
+    Returns the cell we think we ended up in.
+    """
     print("target", path[-1])
-    while step_num < len(path):
-        direction = get_heading(current_location, path[step_num])
-        if direction is None:
-            step_num += 1
-            continue
-        sphero.set_heading(
-            int(direction)  # sphero drive code chokes on floats, cast to int instead.
-        )
-        await asyncio.sleep(0.1)
-        dist = math.dist(current_location, path[step_num])
-        # what magical numbers
-
-        first_step_speed = 0.62 if dist == 1 else 0.83  # account for diagonals
-        mid_step_speed = (
-            first_step_speed * 0.55
-        )  # sphero still has momentum from the last step, so we have to take the speed down
-
-        sphero.set_speed(80)
-
-        await asyncio.sleep(first_step_speed if step_num <= 1 else mid_step_speed)
-        sphero.set_speed(0)
-        current_location = path[step_num]
-        step_num += 1
-        await asyncio.sleep(0.1)
-    await asyncio.sleep(2)
+
+    def replan(location):
+        planner.move_to(location)
+        if not planner.dirty:
+            return None
+        new_path = planner.plan()
+        if not new_path:
+            print("no route to", planner.goal, "anymore, stopping at", location)
+            return False
+        return smooth_path(new_path, planner.grid)
+
+    executor = PathExecutor(sphero, model=model, localizer=localizer)
+    current_location = await executor.run(
+        collapse_collinear(path), replan if planner is not None else None
+    )
+    if pause:
+        await asyncio.sleep(pause)
+    return current_location
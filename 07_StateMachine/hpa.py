@@ -0,0 +1,355 @@
+import heapq
+import math
+
+import numpy as np
+
+from astar import distance, heuristic, reconstruct_path
+from occupancy_grid import MASK_DIRECTIONS, NEIGHBOR_OFFSETS, OccupancyGrid
+
+# Entrance runs at least this long get a transition at each end instead of one
+# in the middle (the value from the HPA* paper).
+LONG_ENTRANCE = 6
+
+
+class HierarchicalPlanner:
+    """
+    HPA* (Botea, Muller & Schaeffer 2004) for big grids.
+
+    The grid is cut into cluster_size x cluster_size clusters. Transitions
+    between neighbouring clusters become abstract nodes, and the distances
+    between the nodes of each cluster are precomputed. A query runs A* over
+    that small graph, and each abstract edge is only turned back into cells
+    when the path is actually walked (see refine). Paths are near-optimal,
+    not guaranteed optimal.
+
+    Intra-cluster distances are all worked out up front. After editing the
+    grid, pass the changed cells to update_cells(); only the borders next
+    to them are rebuilt, and only the clusters on those borders (or holding
+    a changed cell) are thrown away and worked out again when next needed.
+    """
+
+    def __init__(self, grid, cluster_size=16, strategy="manhattan"):
+        self.grid = OccupancyGrid.from_grid(grid)
+        self.cluster_size = cluster_size
+        self.strategy = strategy
+        self.step_costs = [
+            distance((0, 0), offset, strategy) for offset in NEIGHBOR_OFFSETS
+        ]
+        self.clusters_x = math.ceil(self.grid.width / cluster_size)
+        self.clusters_y = math.ceil(self.grid.height / cluster_size)
+
+        self.borders = {}  # (cluster, cluster) -> [(cell id, cell id), ...]
+        self.intra = {}  # cluster -> {node: [(node, cost), ...]}
+        for cluster in self._all_clusters():
+            for other in self._forward_neighbors(cluster):
+                self._build_border(cluster, other)
+        self._rebuild_inter()
+        for cluster in self._all_clusters():
+            self.intra_edges(cluster)
+
+    def _all_clusters(self):
+        return [
+            (cx, cy) for cy in range(self.clusters_y) for cx in range(self.clusters_x)
+        ]
+
+    def _forward_neighbors(self, cluster):
+        # each pair of touching clusters once: east, south, south-east, south-west
+        cx, cy = cluster
+        for dx, dy in ((1, 0), (0, 1), (1, 1), (-1, 1)):
+            other = (cx + dx, cy + dy)
+            if 0 <= other[0] < self.clusters_x and 0 <= other[1] < self.clusters_y:
+                yield other
+
+    def cluster_of(self, node):
+        return (node[0] // self.cluster_size, node[1] // self.cluster_size)
+
+    def _bounds(self, cluster):
+        size = self.cluster_size
+        x0, y0 = cluster[0] * size, cluster[1] * size
+        return x0, y0, min(x0 + size, self.grid.width), min(y0 + size, self.grid.height)
+
+    def _build_border(self, a, b):
+        grid = self.grid
+        passable = grid.passable
+        node_id = grid.node_id
+        ax0, ay0, ax1, ay1 = self._bounds(a)
+        bx0, by0, bx1, by1 = self._bounds(b)
+        transitions = []
+
+        if a[1] == b[1] or a[0] == b[0]:
+            if a[1] == b[1]:  # side by side, walk down the shared column pair
+                pairs = [
+                    (node_id((ax1 - 1, y)), node_id((bx0, y))) for y in range(ay0, ay1)
+                ]
+            else:  # stacked, walk along the shared row pair
+                pairs = [
+                    (node_id((x, ay1 - 1)), node_id((x, by0))) for x in range(ax0, ax1)
+                ]
+            is_open = [passable[p] and passable[q] for p, q in pairs]
+
+            run_start = None
+            for i, open_pair in enumerate(is_open + [False]):
+                if open_pair and run_start is None:
+                    run_start = i
+                elif not open_pair and run_start is not None:
+                    run_end = i - 1
+                    if run_end - run_start + 1 >= LONG_ENTRANCE:
+                        transitions += [pairs[run_start], pairs[run_end]]
+                    else:
+                        transitions.append(pairs[(run_start + run_end) // 2])
+                    run_start = None
+
+            # Diagonal moves can cut through where no straight pair is open.
+            # Only needed when neither straight pair next to it is open,
+            # otherwise an entrance above already connects the same cells.
+            for i, (p, _q) in enumerate(pairs):
+                for j in (i - 1, i + 1):
+                    if 0 <= j < len(pairs) and not is_open[i] and not is_open[j]:
+                        if passable[p] and passable[pairs[j][1]]:
+                            transitions.append((p, pairs[j][1]))
+        else:
+            # clusters touching only at a corner
+            corner_x = ax1 - 1 if b[0] > a[0] else ax0
+            corner = (corner_x, ay1 - 1)
+            other = (bx0 if b[0] > a[0] else bx1 - 1, by0)
+            side_a = (other[0], corner[1])
+            side_b = (corner[0], other[1])
+            if (
+                grid.is_free(corner)
+                and grid.is_free(other)
+                and not grid.is_free(side_a)
+                and not grid.is_free(side_b)
+            ):
+                transitions.append((node_id(corner), node_id(other)))
+
+        self.borders[(a, b)] = list(dict.fromkeys(transitions))
+
+    def _rebuild_inter(self):
+        self.inter = {}
+        self.cluster_nodes = {cluster: set() for cluster in self._all_clusters()}
+        grid = self.grid
+        for (a, b), transitions in self.borders.items():
+            for p, q in transitions:
+                cost = distance(grid.node_at(p), grid.node_at(q), self.strategy)
+                self.inter.setdefault(p, []).append((q, cost))
+                self.inter.setdefault(q, []).append((p, cost))
+                self.cluster_nodes[a].add(p)
+                self.cluster_nodes[b].add(q)
+
+    def _cluster_search(self, source, cluster, targets=None):
+        """
+        Dijkstra from source that never leaves cluster. Returns (g, came_from).
+        Stops early once every id in targets is settled.
+        """
+        grid = self.grid
+        x0, y0, x1, y1 = self._bounds(cluster)
+        stride = grid.stride
+        offsets = grid.offsets
+        neighbor_masks = grid.neighbor_masks
+        step_costs = self.step_costs
+        remaining = set(targets) if targets is not None else None
+
+        g = {source: 0}
+        came_from = {}
+        closed = set()
+        heap = [(0, source)]
+        while heap:
+            cost, current = heapq.heappop(heap)
+            if current in closed:
+                continue
+            closed.add(current)
+            if remaining is not None:
+                remaining.discard(current)
+                if not remaining:
+                    break
+            for k in MASK_DIRECTIONS[neighbor_masks[current]]:
+                neighbor = current + offsets[k]
+                y, x = divmod(neighbor, stride)
+                if not (x0 <= x - 1 < x1 and y0 <= y - 1 < y1) or neighbor in closed:
+                    continue
+                tentative = cost + step_costs[k]
+                if tentative < g.get(neighbor, math.inf):
+                    g[neighbor] = tentative
+                    came_from[neighbor] = current
+                    heapq.heappush(heap, (tentative, neighbor))
+        return g, came_from
+
+    def intra_edges(self, cluster):
+        edges = self.intra.get(cluster)
+        if edges is None:
+            edges = self._intra_distances(cluster)
+            self.intra[cluster] = edges
+        return edges
+
+    def _intra_distances(self, cluster):
+        """
+        Distances between every pair of the cluster's nodes, from all of them
+        at once: a (nodes, height, width) array of distances is relaxed with
+        whole-array minimums until it stops changing, which takes one round
+        per step of the longest path inside the cluster. A cluster is small,
+        so that beats a Dijkstra per node by an order of magnitude.
+        """
+        nodes = sorted(self.cluster_nodes[cluster])
+        if not nodes:
+            return {}
+        grid = self.grid
+        x0, y0, x1, y1 = self._bounds(cluster)
+        h, w = y1 - y0, x1 - x0
+        blocked = ~grid.free_mask[y0 + 1 : y1 + 1, x0 + 1 : x1 + 1]
+        # a ring of inf around the cluster, so paths can't leave it
+        dist = np.full((len(nodes), h + 2, w + 2), np.inf, dtype=np.float32)
+        inner = dist[:, 1:-1, 1:-1]
+        for i, node in enumerate(nodes):
+            x, y = grid.node_at(node)
+            inner[i, y - y0, x - x0] = 0
+        relaxed = np.empty_like(inner)
+        stepped = np.empty_like(inner)
+        while True:
+            relaxed[...] = inner
+            for (dx, dy), cost in zip(NEIGHBOR_OFFSETS, self.step_costs):
+                # into each cell from its neighbour at (dx, dy), same cost both ways
+                np.add(
+                    dist[:, 1 + dy : h + 1 + dy, 1 + dx : w + 1 + dx], cost, out=stepped
+                )
+                np.minimum(relaxed, stepped, out=relaxed)
+            relaxed[:, blocked] = np.inf
+            if not (relaxed < inner).any():
+                break
+            inner[...] = relaxed
+
+        ys = [grid.node_at(node)[1] - y0 for node in nodes]
+        xs = [grid.node_at(node)[0] - x0 for node in nodes]
+        between = inner[:, ys, xs].tolist()  # [from][to]
+        edges = {}
+        for i, node in enumerate(nodes):
+            edges[node] = [
+                (other, cost)
+                for other, cost in zip(nodes, between[i])
+                if other != node and cost != math.inf
+            ]
+        return edges
+
+    def update_cells(self, cells):
+        touched_borders = set()
+        for cell in cells:
+            cluster = self.cluster_of(cell)
+            self.intra.pop(cluster, None)
+            # Every border between two clusters next to the cell can depend on
+            # it: straight ones through their cell pairs, and a corner crossing
+            # through its two side cells, which sit in the other two clusters.
+            near = {cluster}
+            for dx, dy in NEIGHBOR_OFFSETS:
+                neighbor = (cell[0] + dx, cell[1] + dy)
+                if self.grid.in_bounds(neighbor):
+                    near.add(self.cluster_of(neighbor))
+            if len(near) == 1:
+                continue
+            for a in near:
+                for b in self._forward_neighbors(a):
+                    if b in near:
+                        touched_borders.add((a, b))
+        for a, b in touched_borders:
+            self._build_border(a, b)
+            self.intra.pop(a, None)
+            self.intra.pop(b, None)
+        if touched_borders:
+            self._rebuild_inter()
+
+    def abstract_path(self, start, goal):
+        """
+        Cell ids of the abstract path (start, transitions..., goal), or False.
+        """
+        grid = self.grid
+        start_id = grid.node_id(start)
+        goal_id = grid.node_id(goal)
+        if start_id == goal_id:
+            return [start_id]
+        if not grid.is_free(goal) or not grid.in_bounds(start):
+            return False
+
+        goal_cluster = self.cluster_of(goal)
+        g_goal, _ = self._cluster_search(goal_id, goal_cluster)
+        into_goal = {
+            n: g_goal[n] for n in self.cluster_nodes[goal_cluster] if n in g_goal
+        }
+
+        # Temporary edges out of the query's start. A blocked start (the robot
+        # can still step off one, same as a_star) gets an edge to each free
+        # neighbour, and those neighbours get the cluster edges instead.
+        extra_edges = {}
+        if grid.passable[start_id]:
+            entry_points = [start_id]
+        else:
+            entry_points = grid.neighbor_ids(start_id)
+            extra_edges[start_id] = [
+                (n, distance(start, grid.node_at(n), self.strategy))
+                for n in entry_points
+            ]
+        for entry in entry_points:
+            cluster = self.cluster_of(grid.node_at(entry))
+            g_entry, _ = self._cluster_search(entry, cluster)
+            found = [
+                (n, g_entry[n]) for n in self.cluster_nodes[cluster] if n in g_entry
+            ]
+            if goal_id in g_entry:
+                found.append((goal_id, g_entry[goal_id]))
+            extra_edges.setdefault(entry, []).extend(found)
+
+        def edges(node):
+            result = list(
+                self.intra_edges(self.cluster_of(grid.node_at(node))).get(node, [])
+            )
+            result += self.inter.get(node, [])
+            result += extra_edges.get(node, [])
+            if node in into_goal:
+                result.append((goal_id, into_goal[node]))
+            return result
+
+        def h(node):
+            return heuristic(grid.node_at(node), goal, self.strategy)
+
+        open_heap = [(h(start_id), start_id)]
+        g_score = {start_id: 0}
+        came_from = {}
+        closed = set()
+        while open_heap:
+            _f, current = heapq.heappop(open_heap)
+            if current in closed:
+                continue
+            if current == goal_id:
+                return reconstruct_path(came_from, current)
+            closed.add(current)
+            for neighbor, cost in edges(current):
+                tentative = g_score[current] + cost
+                if tentative < g_score.get(neighbor, math.inf):
+                    g_score[neighbor] = tentative
+                    came_from[neighbor] = current
+                    heapq.heappush(open_heap, (tentative + h(neighbor), neighbor))
+        return False
+
+    def refine(self, abstract):
+        """
+        Lazily turn an abstract path into cells, one abstract edge at a time.
+        Yields lists of (x, y) that follow on from each other.
+        """
+        grid = self.grid
+        for a, b in zip(abstract, abstract[1:]):
+            cell_a, cell_b = grid.node_at(a), grid.node_at(b)
+            if max(abs(cell_a[0] - cell_b[0]), abs(cell_a[1] - cell_b[1])) == 1:
+                yield [cell_b]
+                continue
+            cluster = self.cluster_of(cell_a)
+            _g, came_from = self._cluster_search(a, cluster, [b])
+            yield [grid.node_at(n) for n in reconstruct_path(came_from, b)[1:]]
+
+    def plan(self, start, goal):
+        """
+        Same result shape as a_star: a list of (x, y) from start to goal, or False.
+        """
+        abstract = self.abstract_path(start, goal)
+        if not abstract:
+            return False
+        path = [start]
+        for segment in self.refine(abstract):
+            path += segment
+        return path
@@ -0,0 +1,138 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from rolling_stats import RollingWindow
+
+# SpheroEduAPI calls that write to the toy over BLE (and roll/spin, which
+# sleep for their whole duration). Everything else, the sensor getters
+# included, only reads spherov2's cache and is cheap enough for the loop.
+COMMANDS = frozenset(
+    {
+        "set_speed",
+        "set_heading",
+        "roll",
+        "stop_roll",
+        "spin",
+        "reset_aim",
+        "set_stabilization",
+        "set_compass_direction",
+        "calibrate_compass",
+        "set_main_led",
+        "set_front_led",
+        "set_back_led",
+        "set_matrix_character",
+        "scroll_matrix_text",
+        "clear_matrix",
+        "register_matrix_animation",
+        "play_matrix_animation",
+        "play_sound",
+    }
+)
+
+
+class IOPool:
+    """
+    A fixed number of threads sending every robot's BLE commands, so a
+    whole fleet on one event loop never blocks it on a write and doesn't
+    need a thread per robot either.
+
+        pool = IOPool(workers=4)
+        sphero = pool.robot(api)  # use it wherever the SpheroEduAPI went
+        ...
+        pool.shutdown()           # sends whatever's still queued first
+    """
+
+    def __init__(self, workers=4, burst=8):
+        self.workers = workers
+        self.burst = burst
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="ble"
+        )
+        self.robots = []
+
+    def robot(self, sphero):
+        pooled = PooledSphero(self, sphero)
+        self.robots.append(pooled)
+        return pooled
+
+    def shutdown(self, timeout=5.0):
+        for robot in self.robots:
+            robot.idle.wait(timeout)
+        self.executor.shutdown(wait=True)
+
+
+class PooledSphero:
+    """
+    Stands in for a SpheroEduAPI, sending its commands from an IOPool
+    instead of the caller's thread. They're fire and forget: queued per
+    robot and sent in order by at most one worker at a time, so a robot's
+    commands never overtake each other and a slow robot only holds up its
+    own queue. A worker sends at most the pool's `burst` commands for one
+    robot before going to the back of the line, so a busy robot can't
+    starve the rest. Anything that isn't a command goes straight through.
+
+    `waits` has how long commands sat in the queue before being sent over
+    the last few seconds. Read it under `lock`.
+    """
+
+    def __init__(self, pool, sphero, clock=time.monotonic):
+        self._pool = pool
+        self._sphero = sphero
+        self._clock = clock
+        self._queue = deque()
+        self._draining = False
+        self.lock = threading.Lock()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.waits = RollingWindow(256, seconds=5.0)
+        self.worst_wait = 0.0  # since the last report, reset by whoever reads it
+        self.sent = 0
+
+    @property
+    def queued(self):
+        return len(self._queue)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._sphero, name)
+        if name not in COMMANDS:
+            return attribute
+
+        def send(*args, **kwargs):
+            self._submit(attribute, args, kwargs)
+
+        setattr(self, name, send)  # only look it up once
+        return send
+
+    def _submit(self, command, args, kwargs):
+        with self.lock:
+            self._queue.append((self._clock(), command, args, kwargs))
+            if self._draining:
+                return
+            self._draining = True
+            self.idle.clear()
+        self._pool.executor.submit(self._drain)
+
+    def _drain(self):
+        for _ in range(self._pool.burst):
+            with self.lock:
+                if not self._queue:
+                    self._draining = False
+                    self.idle.set()
+                    return
+                queued, command, args, kwargs = self._queue.popleft()
+                now = self._clock()
+                self.waits.push(now - queued, now)
+                self.worst_wait = max(self.worst_wait, now - queued)
+                self.sent += 1
+            try:
+                command(*args, **kwargs)
+            except Exception as e:
+                print("sphero", command.__name__, "error:", e)
+        with self.lock:
+            if not self._queue:
+                self._draining = False
+                self.idle.set()
+                return
+        self._pool.executor.submit(self._drain)
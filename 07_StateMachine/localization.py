@@ -0,0 +1,132 @@
+import asyncio
+import math
+
+import numpy as np
+
+from constants import CELL_SIZE_CM
+from occupancy_grid import OccupancyGrid
+
+
+def heading_vector(heading):
+    # same convention as grid_utils.get_heading: 0 is up the grid (-y), 90 is +x
+    radians = math.radians(heading)
+    return math.sin(radians), -math.cos(radians)
+
+
+class Localizer:
+    """
+    Estimates where the robot is in grid cells while it drives.
+
+    Fuses the robot's locator and velocity readings, taken from the robot's
+    SensorHub like every other sensor, with a complementary filter: each
+    velocity sample moves the pose by the encoder speed along the heading
+    the robot is holding (the controller keeps that well, the encoders'
+    sideways velocity is mostly noise), then each locator sample pulls the
+    estimate back by `gain`. PathExecutor re-aims from the estimate every
+    `period` seconds, about the hub's rate for these channels.
+
+    The locator is relative to wherever the program started, in cm with +y
+    forward, so reset() anchors it to a known cell, at the first locator
+    sample after it.
+    """
+
+    def __init__(
+        self,
+        sphero,
+        grid,
+        hub,
+        start=(0, 0),
+        cell_size=CELL_SIZE_CM,
+        period=0.1,
+        gain=0.2,
+    ):
+        self.sphero = sphero
+        self.grid = OccupancyGrid.from_grid(grid)
+        self.hub = hub
+        self.cell_size = cell_size
+        self.period = period
+        self.gain = gain
+        self.anchor = None
+        self.pose = np.zeros(2)
+        self.speed = 0.0  # cells per second
+        self.subscriptions = []
+        self.tasks = []
+        self.reset(start)
+
+    def reset(self, cell):
+        """Tells the filter the robot is (exactly enough) at cell."""
+        self.pose = np.array(cell, dtype=float)
+        self.anchor = None
+        self.speed = 0.0
+
+    def predict(self, velocity, dt):
+        self.speed = math.hypot(velocity["x"], velocity["y"]) / self.cell_size
+        # the heading we last sent, spherov2 keeps it so it isn't a read
+        direction = np.array(heading_vector(self.sphero.get_heading()))
+        self.pose = self.pose + direction * self.speed * dt
+        return self.pose
+
+    def correct(self, location):
+        located = np.array([location["x"], -location["y"]]) / self.cell_size
+        if self.anchor is None:
+            self.anchor = self.pose - located
+        self.pose = self.pose + self.gain * (self.anchor + located - self.pose)
+        return self.pose
+
+    async def _follow_velocity(self, subscription):
+        last = None
+        while True:
+            sample = await subscription.next()
+            if last is not None:
+                self.predict(sample.value, sample.time - last)
+            last = sample.time
+
+    async def _follow_location(self, subscription):
+        while True:
+            self.correct((await subscription.next()).value)
+
+    def start(self):
+        if self.tasks:
+            return
+        velocity = self.hub.subscribe("velocity")
+        location = self.hub.subscribe("location")
+        self.subscriptions = [velocity, location]
+        self.tasks = [
+            asyncio.create_task(self._follow_velocity(velocity)),
+            asyncio.create_task(self._follow_location(location)),
+        ]
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        for subscription in self.subscriptions:
+            self.hub.unsubscribe(subscription)
+        self.subscriptions = []
+
+    def position(self):
+        return float(self.pose[0]), float(self.pose[1])
+
+    def cell(self, ahead=0.0):
+        """
+        Nearest free cell to the estimate, for the planner to start from.
+        ahead projects it that many seconds on at the current speed and
+        heading, e.g. to where a robot that's just been stopped will coast to.
+        """
+        direction = np.array(heading_vector(self.sphero.get_heading()))
+        x, y = self.pose + direction * self.speed * ahead
+        cell = (
+            min(max(int(round(x)), 0), self.grid.width - 1),
+            min(max(int(round(y)), 0), self.grid.height - 1),
+        )
+        if self.grid.is_free(cell):
+            return cell
+        free = [
+            (nx, ny)
+            for nx in range(cell[0] - 1, cell[0] + 2)
+            for ny in range(cell[1] - 1, cell[1] + 2)
+            if self.grid.is_free((nx, ny))
+        ]
+        if not free:
+            return cell  # wedged in a wall, let the planner deal with it
+        return min(free, key=lambda c: math.dist(c, (x, y)))
@@ -4,6 +4,9 @@ from spherov2 import scanner
 from spherov2 import toy
 from spherov2.sphero_edu import SpheroEduAPI
 
+from constants import SENSOR_LOG, STREAM_INTERVAL, TOY_NAME
+from sensor_log import SensorRecorder
+from state_machine import StateMachine
 from states import (
     Caught,
     Chasing,
@@ -13,11 +16,12 @@ from states import (
     StateName,
     Terminal,
     TimedOut,
+    game_for,
 )
 
 
-async def main(sphero):
-    states = {
+def make_states(sphero):
+    return {
         StateName.INITIAL: Initial(sphero, StateName.INITIAL),
         StateName.CHOOSING: Choosing(sphero, StateName.CHOOSING),
         StateName.EVADING: Evading(sphero, StateName.EVADING),
@@ -27,26 +31,36 @@ async def main(sphero):
         StateName.TERMINAL: Terminal(sphero, StateName.TERMINAL),
     }
 
-    current_state = states[StateName.CHOOSING]
-    await current_state.start()
 
-    while current_state.name != StateName.TERMINAL:
-        result = await current_state.execute()
-        if result:
-            await current_state.stop()
-            current_state = states[result]
-            await current_state.start()
-
-    # Run terminal state for one cycle
-    await current_state.start()
-    await current_state.execute()
-    await current_state.stop()
+async def main(sphero, toy=None):
+    # this toy's calibration, made before the states so they all share it
+    game = game_for(sphero, toy.name if toy is not None else TOY_NAME)
+    states = make_states(sphero)
+    # Transitions fire as soon as their event (timer, light, tap, toss)
+    # arrives instead of on the next poll.
+    machine = StateMachine(states, StateName.CHOOSING, StateName.TERMINAL)
+    hub = game.hub
+    if toy is not None:
+        # gyro and attitude straight off the toy's stream, fast enough for
+        # Choosing's spin detection to react within a few samples
+        hub.attach_stream(toy, interval=STREAM_INTERVAL)
+    recorder = None
+    if SENSOR_LOG:
+        recorder = SensorRecorder(SENSOR_LOG)
+        hub.taps.append(recorder.record)
+    hub.start()
+    try:
+        await machine.run()
+    finally:
+        hub.stop()
+        if recorder is not None:
+            recorder.close()
 
 
 if __name__ == "__main__":
-    toy = scanner.find_toy(toy_name="SB-F11F")
+    toy = scanner.find_toy(toy_name=TOY_NAME)
     with SpheroEduAPI(toy) as sphero:
         try:
-            asyncio.run(main(sphero))
+            asyncio.run(main(sphero, toy))
         except KeyboardInterrupt:
             print("KeyboardInterrupt received, exiting...")
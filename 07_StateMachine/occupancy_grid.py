@@ -0,0 +1,227 @@
+import numpy as np
+
+# (dx, dy) for the 8-connected neighbourhood, same order as astar.get_neighbors
+NEIGHBOR_OFFSETS = (
+    (-1, 0),
+    (-1, -1),
+    (-1, 1),
+    (1, 0),
+    (1, -1),
+    (1, 1),
+    (0, -1),
+    (0, 1),
+)
+
+# For every possible 8-bit neighbour mask, which directions are set. Lets the
+# planner loop over only the open neighbours without testing each bit.
+MASK_DIRECTIONS = tuple(
+    tuple(k for k in range(len(NEIGHBOR_OFFSETS)) if mask & (1 << k))
+    for mask in range(1 << len(NEIGHBOR_OFFSETS))
+)
+
+
+class OccupancyGrid:
+    """
+    Grid of free (0) and blocked (non-zero) cells backed by a contiguous uint8 array.
+
+    The array is padded with one ring of blocked cells, so every in-bounds cell
+    has 8 valid neighbour indices and the planner never has to bounds check.
+    Nodes are addressed by flat index into the padded array (see node_id).
+    """
+
+    def __init__(self, cells):
+        cells = np.asarray(cells, dtype=np.uint8)
+        if cells.ndim != 2:
+            raise ValueError(f"expected a 2D grid, got shape {cells.shape}")
+        self.height, self.width = cells.shape
+        self.stride = self.width + 2
+        self.padded = np.ones((self.height + 2, self.width + 2), dtype=np.uint8)
+        self.padded[1:-1, 1:-1] = cells
+        # flat index delta for each entry of NEIGHBOR_OFFSETS
+        self.offsets = tuple(dy * self.stride + dx for dx, dy in NEIGHBOR_OFFSETS)
+        self.version = 0
+        self._components = None
+        self._refresh_masks()
+
+    @classmethod
+    def from_grid(cls, grid):
+        if isinstance(grid, cls):
+            return grid
+        return cls(grid)
+
+    @property
+    def cells(self):
+        return self.padded[1:-1, 1:-1]
+
+    @property
+    def shape(self):
+        return (self.height, self.width)
+
+    def _refresh_masks(self):
+        free = self.padded == 0
+        masks = np.zeros(self.padded.shape, dtype=np.uint8)
+        h, w = self.height, self.width
+        for k, (dx, dy) in enumerate(NEIGHBOR_OFFSETS):
+            neighbor_free = free[1 + dy : h + 1 + dy, 1 + dx : w + 1 + dx]
+            masks[1:-1, 1:-1] |= neighbor_free.astype(np.uint8) << k
+        self.free_mask = free
+        # Plain lists for the planner's inner loop, indexing numpy scalars is slow.
+        self.neighbor_masks = masks.ravel().tolist()
+        self.passable = free.ravel().tolist()
+
+    def node_id(self, node):
+        return (node[1] + 1) * self.stride + node[0] + 1
+
+    def node_at(self, node_id):
+        y, x = divmod(node_id, self.stride)
+        return (x - 1, y - 1)
+
+    def in_bounds(self, node):
+        return 0 <= node[0] < self.width and 0 <= node[1] < self.height
+
+    def is_free(self, node):
+        return self.in_bounds(node) and self.passable[self.node_id(node)]
+
+    def neighbor_ids(self, node_id):
+        offsets = self.offsets
+        return [
+            node_id + offsets[k] for k in MASK_DIRECTIONS[self.neighbor_masks[node_id]]
+        ]
+
+    def neighbors(self, node):
+        return [self.node_at(n) for n in self.neighbor_ids(self.node_id(node))]
+
+    def free_ids(self):
+        return np.flatnonzero(self.free_mask)
+
+    @property
+    def components(self):
+        # built on first use, then kept up to date by set_cells
+        if self._components is None:
+            self._components = ComponentLabels(self)
+        return self._components
+
+    def set_cells(self, nodes, value):
+        freed = []
+        blocked = []
+        for x, y in nodes:
+            if not self.in_bounds((x, y)):
+                raise IndexError(
+                    f"cell {(x, y)} is outside a {self.width}x{self.height} grid"
+                )
+            node_id = self.node_id((x, y))
+            was_free = self.passable[node_id]
+            self.padded[y + 1, x + 1] = value
+            if was_free and value:
+                blocked.append(node_id)
+            elif not was_free and not value:
+                freed.append(node_id)
+        if not freed and not blocked:
+            return
+        self.version += 1
+        self._refresh_masks()
+        if self._components is not None:
+            self._components.cells_changed(freed, blocked)
+
+    def to_list(self):
+        return self.cells.tolist()
+
+    def __getitem__(self, row):
+        # so grid[y][x] keeps working for code written against nested lists
+        return self.cells[row]
+
+    def __len__(self):
+        return self.height
+
+
+class ComponentLabels:
+    """
+    Union-find over the free cells of an OccupancyGrid, 8-connected like the planner.
+
+    Opening a cell just unions it with its neighbours. Blocking a cell can
+    split its component, so only that component is taken apart and relinked.
+    """
+
+    def __init__(self, grid):
+        self.grid = grid
+        self.parent = [
+            node_id if free else -1 for node_id, free in enumerate(grid.passable)
+        ]
+        self._labels = None
+        self._members = {}
+        self._link(node_id for node_id, free in enumerate(grid.passable) if free)
+
+    def find(self, node_id):
+        parent = self.parent
+        while parent[node_id] != node_id:
+            parent[node_id] = parent[parent[node_id]]  # path halving
+            node_id = parent[node_id]
+        return node_id
+
+    def _union(self, a, b):
+        root_a = self.find(a)
+        root_b = self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    def _link(self, node_ids):
+        offsets = self.grid.offsets
+        neighbor_masks = self.grid.neighbor_masks
+        for node_id in node_ids:
+            for k in MASK_DIRECTIONS[neighbor_masks[node_id]]:
+                self._union(node_id, node_id + offsets[k])
+
+    def labels(self):
+        """
+        Flat array over the padded grid: component root for free cells, -1 for blocked.
+        """
+        if self._labels is None:
+            self._labels = np.array(
+                [self.find(i) if p >= 0 else -1 for i, p in enumerate(self.parent)],
+                dtype=np.int64,
+            )
+            self._members = {}
+        return self._labels
+
+    def members(self, label):
+        """
+        Sorted flat ids of every cell in a component.
+        """
+        labels = self.labels()
+        if label not in self._members:
+            self._members[label] = np.flatnonzero(labels == label)
+        return self._members[label]
+
+    def reachable_ids(self, node):
+        """
+        Sorted flat ids of every free cell the planner can reach from node.
+        """
+        grid = self.grid
+        if not grid.in_bounds(node):
+            return np.empty(0, dtype=np.int64)
+        node_id = grid.node_id(node)
+        if grid.passable[node_id]:
+            return self.members(self.find(node_id))
+        # standing on a blocked cell, a_star can still step off onto any free neighbour
+        roots = {self.find(n) for n in grid.neighbor_ids(node_id)}
+        if not roots:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate([self.members(root) for root in roots]))
+
+    def cells_changed(self, freed, blocked):
+        stale = set()
+        if blocked:
+            labels = self.labels()  # still the labels from before the change
+            for node_id in blocked:
+                stale.update(self.members(int(labels[node_id])).tolist())
+        for node_id in blocked:
+            self.parent[node_id] = -1
+            stale.discard(node_id)
+        for node_id in stale:
+            self.parent[node_id] = node_id
+        for node_id in freed:
+            self.parent[node_id] = node_id
+        self._link(stale)
+        self._link(freed)
+        self._labels = None
+        self._members = {}
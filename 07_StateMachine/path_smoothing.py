@@ -0,0 +1,102 @@
+import math
+
+from occupancy_grid import OccupancyGrid
+
+
+def sign(value):
+    return (value > 0) - (value < 0)
+
+
+def cells_on_line(a, b):
+    """
+    Every cell the segment between the centres of a and b passes through.
+    Where it goes exactly through a corner both side cells are included,
+    since the robot is wider than a line.
+    """
+    x, y = a
+    dx, dy = abs(b[0] - x), abs(b[1] - y)
+    step_x, step_y = sign(b[0] - x), sign(b[1] - y)
+    cells = [(x, y)]
+    moved_x = moved_y = 0
+    while moved_x < dx or moved_y < dy:
+        # which cell boundary the line crosses next, compared without division
+        crossing = (1 + 2 * moved_x) * dy - (1 + 2 * moved_y) * dx
+        if crossing == 0:
+            cells.append((x + step_x, y))
+            cells.append((x, y + step_y))
+            x, y = x + step_x, y + step_y
+            moved_x, moved_y = moved_x + 1, moved_y + 1
+        elif crossing < 0:
+            x += step_x
+            moved_x += 1
+        else:
+            y += step_y
+            moved_y += 1
+        cells.append((x, y))
+    return cells
+
+
+def has_line_of_sight(grid, a, b, cost_map=None, max_cost=math.inf):
+    """
+    With a cost_map, the cells strictly between a and b also mustn't cost
+    more than max_cost to enter.
+    """
+    if max(abs(a[0] - b[0]), abs(a[1] - b[1])) <= 1:
+        return True  # one planner step, already known to be fine
+    grid = OccupancyGrid.from_grid(grid)
+    cells = cells_on_line(a, b)
+    if not all(grid.is_free(cell) for cell in cells[1:]):
+        return False
+    return cost_map is None or all(
+        cost_map.cost(cell) <= max_cost for cell in cells[1:-1]
+    )
+
+
+def collapse_collinear(path):
+    """
+    Drop waypoints in the middle of straight runs,
+    [(0,0), (1,0), (2,0)] -> [(0,0), (2,0)].
+    """
+    if len(path) < 3:
+        return list(path)
+    result = [path[0]]
+    for previous, current, following in zip(path, path[1:], path[2:]):
+        first = (current[0] - previous[0], current[1] - previous[1])
+        second = (following[0] - current[0], following[1] - current[1])
+        if first[0] * second[1] != first[1] * second[0] or (
+            first[0] * second[0] + first[1] * second[1] < 0
+        ):
+            result.append(current)
+    result.append(path[-1])
+    return result
+
+
+def smooth_path(path, grid, cost_map=None):
+    """
+    Line-of-sight string pulling: from each waypoint, jump straight to the
+    furthest later waypoint the robot can see. Turns a cell-by-cell path
+    into a few long any-angle segments.
+
+    Pass the cost_map the path was planned with, or the shortcuts cut
+    straight back along the walls it steered around: then a shortcut may
+    not cross a cell costlier than the worst one on the stretch of path it
+    replaces (endpoints aside).
+    """
+    if not path or len(path) < 3:
+        return path
+    grid = OccupancyGrid.from_grid(grid)
+    costs = [cost_map.cost(cell) for cell in path] if cost_map is not None else None
+    result = [path[0]]
+    anchor = 0
+    while anchor < len(path) - 1:
+        furthest = anchor + 1
+        for candidate in range(len(path) - 1, anchor + 1, -1):
+            max_cost = max(costs[anchor + 1 : candidate]) if costs else math.inf
+            if has_line_of_sight(
+                grid, path[anchor], path[candidate], cost_map, max_cost
+            ):
+                furthest = candidate
+                break
+        result.append(path[furthest])
+        anchor = furthest
+    return collapse_collinear(result)
@@ -0,0 +1,125 @@
+from collections import deque
+from contextlib import contextmanager
+import statistics
+import time
+
+
+class PlannerStats:
+    """
+    Counters for one planner query, filled in when passed as a_star(stats=...)
+    or to a flow field build (FlowFieldCache.path(stats=...)).
+
+    The planner swaps in counting versions of its heap and heuristic calls
+    only when a collector is given, so leaving it out costs nothing. A flow
+    field's wavefront has no heap or heuristic: there expanded counts every
+    cell whose neighbours were relaxed, pushed every improvement and
+    max_open the largest pending set.
+    """
+
+    FIELDS = (
+        "expanded",
+        "pushed",
+        "improved",
+        "max_open",
+        "heuristic_evals",
+        "wall_time",
+    )
+
+    def __init__(self):
+        self.expanded = 0
+        self.pushed = 0
+        self.improved = 0
+        self.max_open = 0
+        self.heuristic_evals = 0
+        self.wall_time = 0.0
+        self._pushed_before = 0
+
+    def instrument(self, push, h_fn):
+        # pushed is a running total if the stats are reused, record_search
+        # only wants this search's
+        self._pushed_before = self.pushed
+
+        def counting_push(heap, item):
+            push(heap, item)
+            self.pushed += 1
+            if len(heap) > self.max_open:
+                self.max_open = len(heap)
+
+        def counting_h(node):
+            self.heuristic_evals += 1
+            return h_fn(node)
+
+        return counting_push, counting_h
+
+    def record_search(self, open_heap, closed_nodes, g_score):
+        self.max_open = max(self.max_open, len(open_heap))
+        self.expanded += len(closed_nodes)
+        # Every node gets one push when first found (the start node is seeded
+        # straight into the heap), any more are a cheaper way to a node that's
+        # still open. Closed nodes are skipped, so nothing is ever reopened.
+        pushed = self.pushed - self._pushed_before
+        self.improved += pushed - (len(g_score) - 1)
+
+    def record_wavefront(self, expanded, pushed, reached, max_pending):
+        self.expanded += expanded
+        self.pushed += pushed
+        self.max_open = max(self.max_open, max_pending)
+        # as in record_search, the goal is seeded and every other cell
+        # reached had one first push
+        self.improved += pushed - max(reached - 1, 0)
+
+    @contextmanager
+    def timed(self):
+        t0 = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.wall_time += time.perf_counter() - t0
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __repr__(self):
+        return (
+            f"PlannerStats({', '.join(f'{k}={v}' for k, v in self.as_dict().items())})"
+        )
+
+
+class StatsSummary:
+    """
+    Rolling summary over the last `window` queries.
+    """
+
+    def __init__(self, window=50):
+        self.queries = deque(maxlen=window)
+        self.total_queries = 0
+
+    def add(self, stats):
+        self.queries.append(stats)
+        self.total_queries += 1
+
+    def as_dict(self):
+        if not self.queries:
+            return {"queries": 0}
+        summary = {"queries": self.total_queries, "window": len(self.queries)}
+        for field in PlannerStats.FIELDS:
+            values = [getattr(stats, field) for stats in self.queries]
+            summary[field] = {
+                "mean": statistics.fmean(values),
+                "max": max(values),
+            }
+        return summary
+
+    def format(self):
+        if not self.queries:
+            return "no planner queries yet"
+        summary = self.as_dict()
+        wall = summary["wall_time"]
+        return (
+            f"{summary['window']} of {summary['queries']} queries: "
+            f"{wall['mean'] * 1000:.2f} ms mean, {wall['max'] * 1000:.2f} ms max, "
+            f"{summary['expanded']['mean']:.0f} expanded, "
+            f"{summary['pushed']['mean']:.0f} pushed, "
+            f"{summary['improved']['mean']:.0f} improved, "
+            f"{summary['max_open']['max']} max open"
+        )
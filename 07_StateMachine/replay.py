@@ -0,0 +1,89 @@
+"""
+Replays a sensor log (see sensor_log.py) into the game's states, against a
+simulated robot, to see when and why they fire.
+
+    python replay.py game.sphlog          # at the speed it was recorded
+    python replay.py game.sphlog --fast   # on virtual time, same timing, no waiting
+
+Prints every state change and every time the light crosses
+LIGHT_THRESHHOLD, both relative to the start of the log.
+"""
+
+import argparse
+import asyncio
+
+from constants import LIGHT_THRESHHOLD, TOY_NAME
+from main import make_states
+from sensor_log import SensorReplayer, read_log
+from sim_sphero import SimulatedSpheroEduAPI, SimulationConfig, find_toy
+from state_machine import StateMachine
+from states import StateName, game_for
+import virtual_time
+
+
+async def watch_states(machine, start, poll=0.01):
+    loop = asyncio.get_running_loop()
+    current = None
+    while True:
+        state = machine.current
+        if state is not None and state.name != current:
+            current = state.name
+            print(f"{loop.time() - start:8.3f}  state {current.value}")
+        await asyncio.sleep(poll)
+
+
+def light_tap(start):
+    above = False
+
+    def tap(name, sample):
+        nonlocal above
+        if name != "luminosity":
+            return
+        if (sample.value >= LIGHT_THRESHHOLD) != above:
+            above = not above
+            word = "above" if above else "below"
+            elapsed = sample.time - start
+            print(f"{elapsed:8.3f}  light {sample.value:.0f} {word} threshold")
+
+    return tap
+
+
+async def replay(sphero, records, speed, linger=1.0):
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    machine = StateMachine(make_states(sphero), StateName.CHOOSING, StateName.TERMINAL)
+    hub = game_for(sphero).hub  # never started, the log is its only source
+    hub.taps.append(light_tap(start))
+    watcher = asyncio.create_task(watch_states(machine, start))
+    game = asyncio.create_task(machine.run())
+    try:
+        await SensorReplayer(records, speed).run(hub)
+        await asyncio.wait({game}, timeout=linger)
+    finally:
+        for task in (watcher, game):
+            task.cancel()
+        await asyncio.gather(watcher, game, return_exceptions=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a sensor log into the states")
+    parser.add_argument("log")
+    parser.add_argument("--fast", action="store_true", help="run on virtual time")
+    args = parser.parse_args()
+
+    records = read_log(args.log)
+    if not len(records):
+        print("empty log")
+        return
+    print(f"{len(records)} records, {records['time'][-1] - records['time'][0]:.1f} s")
+    clock = virtual_time.VirtualClock() if args.fast else None
+    config = SimulationConfig(clock=clock, threaded_events=not args.fast)
+    sphero = SimulatedSpheroEduAPI(find_toy(TOY_NAME, config))
+    if args.fast:
+        virtual_time.run(replay(sphero, records, 1.0), clock)
+    else:
+        asyncio.run(replay(sphero, records, 1.0))
+
+
+if __name__ == "__main__":
+    main()
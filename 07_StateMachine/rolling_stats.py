@@ -0,0 +1,81 @@
+import math
+
+import numpy as np
+
+
+class RollingWindow:
+    """
+    Mean and variance over the most recent samples in O(1) per sample.
+
+    Samples live in a preallocated ring buffer and the statistics are kept
+    up to date with Welford's update as samples enter and leave, so nothing
+    is ever summed over the whole window. The window is the last `capacity`
+    samples, and if `seconds` is given also only samples at most that old
+    (by their own timestamps, so it works at whatever rate they arrive).
+    """
+
+    def __init__(self, capacity, seconds=None):
+        self.capacity = capacity
+        self.seconds = seconds
+        self.values = np.zeros(capacity)
+        self.times = np.zeros(capacity)
+        self.clear()
+
+    def clear(self):
+        self.start = 0
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def __len__(self):
+        return self.count
+
+    def _drop_oldest(self):
+        value = float(self.values[self.start])
+        self.start = (self.start + 1) % self.capacity
+        self.count -= 1
+        if self.count == 0:
+            self.mean = self._m2 = 0.0
+            return
+        delta = value - self.mean
+        self.mean -= delta / self.count
+        self._m2 = max(0.0, self._m2 - delta * (value - self.mean))
+
+    def expire(self, now):
+        """Drops samples older than `seconds` before now."""
+        if self.seconds is None:
+            return
+        while self.count and self.times[self.start] < now - self.seconds:
+            self._drop_oldest()
+
+    def push(self, value, time=0.0):
+        self.expire(time)
+        if self.count == self.capacity:
+            self._drop_oldest()
+        end = (self.start + self.count) % self.capacity
+        self.values[end] = value
+        self.times[end] = time
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def total(self):
+        return self.mean * self.count
+
+    @property
+    def variance(self):
+        return self._m2 / self.count if self.count else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    @property
+    def span(self):
+        """Seconds between the oldest and newest sample."""
+        if self.count < 2:
+            return 0.0
+        newest = (self.start + self.count - 1) % self.capacity
+        return float(self.times[newest] - self.times[self.start])
@@ -0,0 +1,250 @@
+import asyncio
+from collections import namedtuple
+import functools
+import threading
+import time
+
+from spherov2.sphero_edu import EventType
+
+from event_channel import EventChannel
+
+Sample = namedtuple("Sample", "time value")
+
+# how to read each sensor off a SpheroEduAPI
+READERS = {
+    "luminosity": lambda sphero: sphero.get_luminosity()["ambient_light"],
+    "gyroscope": lambda sphero: sphero.get_gyroscope(),
+    "orientation": lambda sphero: sphero.get_orientation(),
+    "location": lambda sphero: sphero.get_location(),
+    "velocity": lambda sphero: sphero.get_velocity(),
+}
+
+# sensors the toy streams on its own, toy sensor name -> our channel
+STREAMED = {
+    "gyroscope": "gyroscope",
+    "attitude": "orientation",
+    "locator": "location",
+    "velocity": "velocity",
+}
+
+# sphero events, published like samples (value True) on channels of these names
+EVENTS = {
+    "collision": EventType.on_collision,
+    "landing": EventType.on_landing,
+}
+
+EVENT_WINDOW = 0.25  # s, collisions come in bursts, one per this is plenty
+
+DEFAULT_RATES = {  # Hz
+    "luminosity": 5,
+    # these two come out of spherov2's stream cache, fast enough for
+    # Choosing's spin window even when the stream isn't attached
+    "gyroscope": 40,
+    "orientation": 40,
+    # what the Localizer fuses, at the rate PathExecutor re-aims from it
+    "location": 10,
+    "velocity": 10,
+}
+
+
+class Channel:
+    """
+    Latest-value channel: only the newest sample is kept, a slow subscriber
+    skips whatever it missed instead of working through a backlog.
+    Only touched from the event loop.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.latest = None
+        self.subscribers = 0
+        self._changed = None
+
+    def publish(self, sample):
+        self.latest = sample
+        changed, self._changed = self._changed, None
+        if changed is not None and not changed.done():
+            changed.set_result(sample)
+
+    async def wait(self):
+        if self._changed is None:
+            self._changed = asyncio.get_running_loop().create_future()
+        # shielded so one cancelled waiter doesn't cancel it for the others
+        return await asyncio.shield(self._changed)
+
+
+class Subscription:
+    def __init__(self, channel):
+        self.channel = channel
+        # only samples from after we subscribed, a stale one could be from
+        # before whatever the subscriber is waiting for
+        self.seen = channel.latest
+
+    @property
+    def latest(self):
+        return self.channel.latest
+
+    async def next(self):
+        """The newest sample we haven't seen yet, waiting for one if need be."""
+        sample = self.channel.latest
+        while sample is None or sample is self.seen:
+            sample = await self.channel.wait()
+        self.seen = sample
+        return sample
+
+
+class SensorHub:
+    """
+    One per robot. Reads every sensor somebody is subscribed to at its
+    configured rate, all on one dedicated I/O thread, so no two states ever
+    ask for the same BLE read and none of them run their own polling loop.
+    Samples are timestamped on the reading thread and handed to the event
+    loop's channels.
+
+    Sensors the toy already streams can be taken straight from the stream
+    instead (attach_stream), at its native rate and with no reads at all.
+
+    Collisions and landings come through here too, from listeners
+    registered once on start, and are also posted to `events` (an
+    EventChannel) for handlers that want them deduplicated. Everything
+    published also goes to the taps
+    (e.g. a sensor_log.SensorRecorder), and publish() is also how a
+    sensor_log.SensorReplayer feeds a recording back in.
+    """
+
+    def __init__(self, sphero, rates=None, clock=time.monotonic):
+        self.sphero = sphero
+        self.rates = dict(DEFAULT_RATES if rates is None else rates)
+        self.clock = clock
+        self.channels = {name: Channel(name) for name in [*self.rates, *EVENTS]}
+        self.taps = []
+        self.events = EventChannel(EVENTS, window=EVENT_WINDOW)
+        self.loop = None
+        self.thread = None
+        self.task = None
+        self.streamed = set()
+        self.watching_events = False
+        self._stopped = threading.Event()
+
+    def publish(self, name, sample):
+        """Only call on the loop."""
+        self.channels[name].publish(sample)
+        if name in EVENTS:
+            self.events.post(name, sample.time)
+        for tap in self.taps:
+            tap(name, sample)
+
+    def subscribe(self, name):
+        channel = self.channels[name]
+        channel.subscribers += 1
+        return Subscription(channel)
+
+    def unsubscribe(self, subscription):
+        subscription.channel.subscribers -= 1
+
+    def attach_stream(self, toy, interval=None):
+        """
+        Publish the toy's own sensor stream. interval (ms) changes how
+        often the toy streams, spherov2 defaults to 250.
+        """
+        if not hasattr(toy, "sensor_control"):
+            return False
+        if interval is not None:
+            toy.sensor_control.set_interval(interval)
+        toy.sensor_control.add_sensor_data_listener(self._on_stream)
+        self.streamed.update(
+            name for name in STREAMED.values() if name in self.channels
+        )
+        return True
+
+    def _on_stream(self, sensor_data):
+        # called on a fresh spherov2 thread per packet
+        loop = self.loop
+        if loop is None:
+            return
+        now = self.clock()
+        for sensor, name in STREAMED.items():
+            if sensor in sensor_data and name in self.streamed:
+                sample = Sample(now, sensor_data[sensor])
+                try:
+                    loop.call_soon_threadsafe(self.publish, name, sample)
+                except RuntimeError:
+                    return  # loop closed under us, we're shutting down
+
+    def _on_event(self, name, _api):
+        # spherov2 calls this on its own thread
+        loop = self.loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self.publish, name, Sample(self.clock(), True))
+        except RuntimeError:
+            pass
+
+    def start(self):
+        if self.thread is not None or self.task is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        if not self.watching_events:
+            for name, event_type in EVENTS.items():
+                self.sphero.register_event(
+                    event_type, functools.partial(self._on_event, name)
+                )
+            self.watching_events = True
+        if getattr(self.loop, "virtual_time", False):
+            # simulated robot on virtual time (see virtual_time.py): reads are
+            # free and a thread would run in real time, so sample on the loop
+            self.clock = self.loop.time
+            self.task = self.loop.create_task(self._run_on_loop())
+            return
+        self._stopped.clear()
+        self.thread = threading.Thread(target=self._run, name="sensor-hub", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        if self.thread is not None:
+            self._stopped.set()
+            self.thread.join()
+            self.thread = None
+        self.loop = None
+
+    def _schedule(self):
+        now = self.clock()
+        return {name: now for name in self.rates if name not in self.streamed}
+
+    def _read(self, name, due):
+        # absolute schedule, but don't try to catch up on reads we missed
+        due[name] = max(due[name] + 1 / self.rates[name], self.clock())
+        if not self.channels[name].subscribers:
+            return None
+        try:
+            value = READERS[name](self.sphero)
+        except Exception as e:
+            print("sensor hub", name, "error:", e)
+            return None
+        return Sample(self.clock(), value) if value is not None else None
+
+    def _run(self):
+        due = self._schedule()
+        while due and not self._stopped.is_set():
+            name = min(due, key=due.get)
+            delay = due[name] - self.clock()
+            if delay > 0 and self._stopped.wait(delay):
+                break
+            sample = self._read(name, due)
+            if sample is not None:
+                self.loop.call_soon_threadsafe(self.publish, name, sample)
+
+    async def _run_on_loop(self):
+        due = self._schedule()
+        while due:
+            name = min(due, key=due.get)
+            delay = due[name] - self.clock()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            sample = self._read(name, due)
+            if sample is not None:
+                self.publish(name, sample)
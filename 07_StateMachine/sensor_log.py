@@ -0,0 +1,164 @@
+"""
+Recording and replaying everything a SensorHub publishes.
+
+The log is a 16 byte header followed by fixed size little-endian records,
+so it can be appended to while a game runs and memory-mapped as a NumPy
+record array afterwards (read_log):
+
+    header  8s magic, u4 version, u4 record size
+    record  f8 time (monotonic s), u1 kind, 7 pad, 3 x f8 values
+
+A record torn by a crash mid-write is ignored on reading.
+"""
+
+import asyncio
+import os
+import struct
+
+import numpy as np
+
+from sensor_hub import Sample
+
+MAGIC = b"SPHLOG\x00\x00"
+VERSION = 1
+HEADER = struct.Struct("<8sII")
+RECORD = struct.Struct("<dB7x3d")
+RECORD_DTYPE = np.dtype(
+    [("time", "<f8"), ("kind", "u1"), ("pad", "V7"), ("values", "<f8", (3,))]
+)
+assert RECORD_DTYPE.itemsize == RECORD.size
+
+# kind codes are part of the file format, only ever append to this
+KINDS = (
+    "luminosity",
+    "gyroscope",
+    "orientation",
+    "collision",
+    "landing",
+    "location",
+    "velocity",
+)
+KIND_CODES = {name: code for code, name in enumerate(KINDS)}
+
+# dict valued samples, which keys go in the three value slots
+FIELDS = {
+    "gyroscope": ("x", "y", "z"),
+    "orientation": ("pitch", "roll", "yaw"),
+    "location": ("x", "y"),
+    "velocity": ("x", "y"),
+}
+
+
+def encode(name, value):
+    fields = FIELDS.get(name)
+    if fields is not None:
+        values = tuple(float(value[field]) for field in fields)
+        return values + (0.0,) * (3 - len(values))
+    if value is True:  # events
+        return (0.0, 0.0, 0.0)
+    return (float(value), 0.0, 0.0)
+
+
+def decode(name, values):
+    fields = FIELDS.get(name)
+    if fields is not None:
+        return {field: float(v) for field, v in zip(fields, values)}
+    if name in ("collision", "landing"):
+        return True
+    return float(values[0])
+
+
+class SensorRecorder:
+    """
+    Append-only writer. Add it to a hub's taps to record everything:
+
+        recorder = SensorRecorder("game.sphlog")
+        hub.taps.append(recorder.record)
+    """
+
+    def __init__(self, path, flush_every=64):
+        self.path = path
+        self.flush_every = flush_every
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        self.pending = 0
+
+    def record(self, name, sample):
+        self.file.write(
+            RECORD.pack(sample.time, KIND_CODES[name], *encode(name, sample.value))
+        )
+        self.pending += 1
+        if self.pending >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        self.pending = 0
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_log(path):
+    """The log's records as a read-only memory-mapped NumPy record array."""
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError(f"{path} is too short to be a sensor log")
+    magic, version, record_size = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+        raise ValueError(f"{path} isn't a version {VERSION} sensor log")
+    count = (os.path.getsize(path) - HEADER.size) // RECORD.size
+    if count == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(
+        path, dtype=RECORD_DTYPE, mode="r", offset=HEADER.size, shape=(count,)
+    )
+
+
+def samples(records, chunk=4096):
+    """(name, Sample) for every record, in order, a chunk of the map at a time."""
+    for begin in range(0, len(records), chunk):
+        block = records[begin : begin + chunk]
+        for time, kind, values in zip(
+            block["time"].tolist(), block["kind"].tolist(), block["values"].tolist()
+        ):
+            name = KINDS[kind]
+            yield name, Sample(time, decode(name, values))
+
+
+class SensorReplayer:
+    """
+    Publishes a recording into a hub, with the gaps between samples as
+    recorded divided by speed. speed=None doesn't wait at all, on a virtual
+    time loop (virtual_time.py) real speed is just as fast and keeps the
+    timing.
+    """
+
+    def __init__(self, records, speed=1.0):
+        self.records = records
+        self.speed = speed
+
+    async def run(self, hub):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        first = None
+        for name, sample in samples(self.records):
+            if first is None:
+                first = sample.time
+            at = start + (sample.time - first) / self.speed if self.speed else None
+            if at is not None and at > loop.time():
+                await asyncio.sleep(at - loop.time())
+            elif self.speed is None:
+                await asyncio.sleep(0)  # let the states react to each sample
+            # restamped on our clock, so windows and timeouts line up
+            hub.publish(
+                name, Sample(at if at is not None else loop.time(), sample.value)
+            )
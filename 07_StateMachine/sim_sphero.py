@@ -0,0 +1,344 @@
+"""
+A simulated Sphero, for running the behaviours without a robot.
+
+SimulatedSpheroEduAPI implements the part of SpheroEduAPI this repo uses on
+top of a 2D kinematic model of a robot rolling around the GRID arena. See
+simulate.py for running an unchanged main.py against it.
+"""
+
+import math
+import random
+import threading
+import time
+
+from spherov2.sphero_edu import EventType
+
+from calibration import MotionModel
+from constants import CELL_SIZE_CM, GRID
+from occupancy_grid import OccupancyGrid
+
+
+class RealClock:
+    def time(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class SimulationConfig:
+    """
+    Everything about the simulated world, handed to the API through the toy
+    so scripts can keep calling SpheroEduAPI(toy).
+
+    The robot itself is a first-order lag towards gain * speed (from a
+    MotionModel, the default one unless given) with a turn rate limit.
+    Every command reaches it `latency` seconds after it's sent.
+
+    Event listeners get their own thread like spherov2's, unless
+    threaded_events is off (on a virtual clock, to keep runs deterministic).
+    """
+
+    def __init__(
+        self,
+        grid=GRID,
+        start=(0, 0),
+        cell_size=CELL_SIZE_CM,
+        latency=0.0,
+        model=None,
+        turn_rate=720.0,
+        ambient_light=100.0,
+        clock=None,
+        seed=None,
+        threaded_events=True,
+    ):
+        self.grid = OccupancyGrid.from_grid(grid)
+        self.start = start
+        self.cell_size = cell_size
+        self.latency = latency
+        self.model = model or MotionModel.default()
+        self.turn_rate = turn_rate  # degrees per second
+        self.ambient_light = ambient_light
+        self.clock = clock or RealClock()
+        self.random = random.Random(seed)
+        self.threaded_events = threaded_events
+
+
+class SimulatedToy:
+    def __init__(self, name, config=None):
+        self.name = name
+        self.config = config or SimulationConfig()
+
+
+def find_toy(toy_name=None, config=None, **kwargs):
+    """Stands in for spherov2.scanner.find_toy."""
+    return SimulatedToy(toy_name or "SB-SIM", config)
+
+
+class SimulatedSpheroEduAPI:
+    """
+    Drop-in for SpheroEduAPI. The robot state is integrated lazily in
+    `step` sized steps up to the clock's current time whenever anything
+    touches it, so it costs nothing while nobody's looking and works the
+    same on a virtual clock. Blocking calls (roll, spin) sleep on the
+    clock, like the real ones block on time.sleep.
+
+    The player is simulated through cover_light, tap, toss and twist.
+    """
+
+    step = 0.01  # seconds
+
+    def __init__(self, toy):
+        self.toy = toy
+        self.config = toy.config
+        self.clock = self.config.clock
+        self._lock = threading.RLock()
+        self._listeners = {event_type: set() for event_type in EventType}
+        self._pending = []  # (time it lands, attribute, value)
+        self._speed = 0  # commanded, as the robot sees it
+        self._heading = 0
+        self._sent_speed = 0  # commanded, as we've sent it
+        self._sent_heading = 0
+        self._compass_zero = None
+        self.stabilization = True
+        self.leds = {}
+        self.matrix = None
+        self._time = self.clock.time()
+        # robot frame, cm from the start cell: x right, y forward (up the grid)
+        self._x = self._y = 0.0
+        self._yaw = 0.0
+        self._yaw_rate = 0.0
+        self._velocity = 0.0
+        self._distance = 0.0
+        self._blocked = False
+        self._light_until = -math.inf
+        self._twist = (0.0, -math.inf)  # (degrees per second, until)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.set_speed(0)
+
+    # Simulation
+
+    def cell_position(self):
+        """Where the robot is, in (fractional) grid cells."""
+        with self._lock:
+            self._advance()
+            return self._cell_position(self._x, self._y)
+
+    def _cell_position(self, x, y):
+        size = self.config.cell_size
+        return self.config.start[0] + x / size, self.config.start[1] - y / size
+
+    def _free_at(self, x, y):
+        cx, cy = self._cell_position(x, y)
+        return self.config.grid.is_free(
+            (int(math.floor(cx + 0.5)), int(math.floor(cy + 0.5)))
+        )
+
+    def _advance(self):
+        now = self.clock.time()
+        while self._time < now:
+            dt = min(self.step, now - self._time)
+            self._time += dt
+            while self._pending and self._pending[0][0] <= self._time:
+                _when, attribute, value = self._pending.pop(0)
+                setattr(self, attribute, value)
+                self._blocked = False  # any new command may get it unstuck
+            self._integrate(dt)
+
+    def _integrate(self, dt):
+        config = self.config
+        twist_rate, twist_until = self._twist
+        if self._time < twist_until:
+            turn = twist_rate * dt
+            # it stays pointing where it was left
+            self._heading = (self._yaw + turn) % 360
+        else:
+            error = (self._heading - self._yaw + 180) % 360 - 180
+            turn = max(-config.turn_rate * dt, min(config.turn_rate * dt, error))
+        self._yaw = (self._yaw + turn) % 360
+        self._yaw_rate = turn / dt
+
+        target = config.model.gain * self._speed * config.cell_size  # cm/s
+        spin_up = max(config.model.spin_up, 1e-3)
+        self._velocity += (target - self._velocity) * min(1.0, dt / spin_up)
+        if self._blocked:
+            self._velocity = 0.0
+            return
+        radians = math.radians(self._yaw)
+        x = self._x + math.sin(radians) * self._velocity * dt
+        y = self._y + math.cos(radians) * self._velocity * dt
+        if self._free_at(x, y):
+            self._distance += math.hypot(x - self._x, y - self._y)
+            self._x, self._y = x, y
+        elif self._velocity != 0:
+            # ran into a wall or off the table, it sits there until told otherwise
+            self._velocity = 0.0
+            self._blocked = True
+            self._fire(EventType.on_collision)
+
+    def _send(self, attribute, value):
+        with self._lock:
+            self._advance()
+            self._pending.append((self._time + self.config.latency, attribute, value))
+
+    def _fire(self, event_type):
+        for listener in list(self._listeners[event_type]):
+            if self.config.threaded_events:
+                threading.Thread(target=listener, args=(self,), daemon=True).start()
+            else:
+                listener(self)
+
+    def cover_light(self, seconds):
+        """The player's hand is over the light sensor for a while (caught)."""
+        with self._lock:
+            self._light_until = self.clock.time() + seconds
+
+    def tap(self):
+        self._fire(EventType.on_collision)
+
+    def toss(self):
+        self._fire(EventType.on_landing)
+
+    def twist(self, rate, seconds):
+        """The player spins the robot in their hand, degrees per second."""
+        with self._lock:
+            self._advance()
+            self._twist = (rate, self._time + seconds)
+
+    # Movement
+
+    def set_speed(self, speed):
+        self._sent_speed = max(-255, min(255, int(speed)))
+        self._send("_speed", self._sent_speed)
+
+    def set_heading(self, heading):
+        self._sent_heading = heading % 360
+        self._send("_heading", self._sent_heading)
+
+    def get_heading(self):
+        return self._sent_heading
+
+    def roll(self, heading, speed, duration):
+        if speed < 0:
+            heading, speed = heading + 180, -speed
+        self.set_heading(heading)
+        self.set_speed(speed)
+        self.clock.sleep(duration)
+        self.set_speed(0)
+
+    def stop_roll(self, heading=None):
+        if heading is not None:
+            self.set_heading(heading)
+        self.set_speed(0)
+
+    def spin(self, angle, duration):
+        if angle == 0:
+            return
+        duration = max(duration, 0.45 * abs(angle) / 360)
+        steps = max(1, int(duration / self.step))
+        start = self._sent_heading
+        for k in range(1, steps + 1):
+            self.set_heading(round(start + angle * k / steps))
+            self.clock.sleep(duration / steps)
+
+    def reset_aim(self):
+        with self._lock:
+            self._advance()
+            self._yaw = 0.0
+            self._sent_heading = 0
+            self._heading = 0
+
+    def calibrate_compass(self):
+        self._compass_zero = 0
+
+    def set_compass_direction(self, direction):
+        if self._compass_zero is None:
+            raise Exception("Compass is not calibrated")
+        self.set_heading(self._compass_zero + direction)
+
+    def set_stabilization(self, stabilize):
+        self.stabilization = stabilize
+
+    # Lights and the matrix, only remembered
+
+    def set_main_led(self, color):
+        self.leds["main"] = color
+
+    def set_front_led(self, color):
+        self.leds["front"] = color
+
+    def set_back_led(self, color):
+        self.leds["back"] = color
+
+    def set_matrix_character(self, character, color):
+        self.matrix = ("character", character, color)
+
+    def scroll_matrix_text(self, text, color, fps, wait):
+        self.matrix = ("text", text, color)
+
+    def clear_matrix(self):
+        self.matrix = None
+
+    def register_matrix_animation(self, frames, palette, fps, transition):
+        pass
+
+    def play_matrix_animation(self, animation_id, loop=True):
+        self.matrix = ("animation", animation_id)
+
+    def play_sound(self, sound):
+        pass
+
+    # Sensors
+
+    def get_luminosity(self):
+        with self._lock:
+            now = self.clock.time()
+            light = self.config.ambient_light
+            if now < self._light_until:
+                light = 1000.0
+            return {"ambient_light": light + self.config.random.gauss(0, 5)}
+
+    def get_gyroscope(self):
+        with self._lock:
+            self._advance()
+            # clockwise is negative
+            return {"x": 0.0, "y": 0.0, "z": -self._yaw_rate}
+
+    def get_orientation(self):
+        with self._lock:
+            self._advance()
+            return {"pitch": 0.0, "roll": 0.0, "yaw": (self._yaw + 180) % 360 - 180}
+
+    def get_location(self):
+        with self._lock:
+            self._advance()
+            return {"x": self._x, "y": self._y}
+
+    def get_velocity(self):
+        with self._lock:
+            self._advance()
+            radians = math.radians(self._yaw)
+            return {
+                "x": math.sin(radians) * self._velocity,
+                "y": math.cos(radians) * self._velocity,
+            }
+
+    def get_distance(self):
+        with self._lock:
+            self._advance()
+            return self._distance
+
+    # Events
+
+    def register_event(self, event_type, listener):
+        if event_type not in EventType:
+            raise ValueError(f"Event type {event_type} does not exist")
+        if listener:
+            self._listeners[event_type].add(listener)
+        else:
+            self._listeners[event_type].clear()
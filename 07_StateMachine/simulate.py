@@ -0,0 +1,85 @@
+"""
+Runs a robot script against the simulated Sphero instead of a real one.
+
+    python simulate.py main.py
+    python simulate.py ../04_MiniStudy/main.py --latency 0.05
+    python simulate.py ../06_SocialInteraction/main.py --start 2 3
+    python simulate.py main.py --virtual-time
+
+spherov2's scanner.find_toy and SpheroEduAPI are swapped for the simulated
+ones before the script is run as __main__, so it needs no changes. Anything
+else the script talks to (microphone, camera) is still real.
+
+With --virtual-time asyncio.run gets a virtual time loop (virtual_time.py)
+sharing its clock with the simulated robot, so sleeps take no time at all.
+"""
+
+import argparse
+import asyncio
+import os
+import runpy
+import sys
+
+import spherov2.scanner
+import spherov2.sphero_edu
+
+import sim_sphero
+import virtual_time
+
+
+def install(config):
+    """Points spherov2 at the simulator, returns a function that undoes it."""
+    original = (spherov2.scanner.find_toy, spherov2.sphero_edu.SpheroEduAPI)
+
+    def find_toy(toy_name=None, **kwargs):
+        return sim_sphero.find_toy(toy_name, config)
+
+    spherov2.scanner.find_toy = find_toy
+    spherov2.sphero_edu.SpheroEduAPI = sim_sphero.SimulatedSpheroEduAPI
+
+    def uninstall():
+        spherov2.scanner.find_toy, spherov2.sphero_edu.SpheroEduAPI = original
+
+    return uninstall
+
+
+def run_script(path, args=()):
+    path = os.path.abspath(path)
+    # the script imports its neighbours, same as running it from its folder
+    sys.path.insert(0, os.path.dirname(path))
+    sys.argv = [path, *args]
+    return runpy.run_path(path, run_name="__main__")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a script on a simulated Sphero")
+    parser.add_argument("script")
+    parser.add_argument(
+        "--latency", type=float, default=0.03, help="BLE command latency, s"
+    )
+    parser.add_argument(
+        "--start", type=int, nargs=2, default=(0, 0), metavar=("X", "Y")
+    )
+    parser.add_argument("--seed", type=int)
+    parser.add_argument(
+        "--virtual-time", action="store_true", help="don't wait for sleeps"
+    )
+    parser.add_argument("script_args", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    clock = virtual_time.VirtualClock() if args.virtual_time else None
+    config = sim_sphero.SimulationConfig(
+        start=tuple(args.start),
+        latency=args.latency,
+        seed=args.seed,
+        clock=clock,
+        threaded_events=not args.virtual_time,
+    )
+    install(config)
+    if clock is not None:
+        asyncio.set_event_loop_policy(virtual_time.VirtualTimePolicy(clock))
+    run_script(args.script, args.script_args)
+
+
+if __name__ == "__main__":
+    main()
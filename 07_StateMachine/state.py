@@ -5,6 +5,7 @@ class State(ABC):
     def __init__(self, sphero, name):
         self.sphero = sphero
         self.name = name
+        self.machine = None  # set by the StateMachine that runs this state
 
     @abstractmethod
     async def start(self):
@@ -17,3 +18,28 @@ class State(ABC):
     @abstractmethod
     async def stop(self):
         raise NotImplementedError()
+
+    def transition(self, name):
+        """
+        Leave this state for `name` as soon as possible, from any callback on
+        the event loop. Returns False if another transition already won.
+        """
+        return self.machine.transition(name, self)
+
+    def call_later(self, delay, name):
+        """
+        Transition to `name` after `delay` seconds unless something else
+        happens first.
+        """
+        return self.machine.call_later(delay, name, self)
+
+
+class EventState(State):
+    """
+    A state that only reacts to events: start() registers timers, sensor
+    callbacks etc. that call transition(), and execute() just waits for the
+    first of them.
+    """
+
+    async def execute(self):
+        return await self.machine.next_transition()
@@ -0,0 +1,83 @@
+import asyncio
+
+
+class StateMachine:
+    """
+    Runs states until the terminal one, without polling.
+
+    Each state is started, then its execute() races against the first
+    transition() (from a timer, a sensor callback or a sphero event) and
+    whichever finishes first decides the next state. Plain polling states
+    whose execute() returns None until it's done still work, execute() is
+    just called again. Timers and transitions belong to the state that made
+    them, so a late one from a state we already left is ignored.
+    """
+
+    def __init__(self, states, initial, terminal):
+        self.states = states
+        self.initial = initial
+        self.terminal = terminal
+        self.current = None
+        self.loop = None
+        self._next = None
+        self._timers = []
+        for state in states.values():
+            state.machine = self
+
+    def transition(self, name, source=None):
+        if source is not None and source is not self.current:
+            return False
+        if self._next is None or self._next.done():
+            return False
+        self._next.set_result(name)
+        return True
+
+    def call_later(self, delay, name, source=None):
+        handle = self.loop.call_later(delay, self.transition, name, source)
+        self._timers.append(handle)
+        return handle
+
+    async def next_transition(self):
+        # shielded, cancelling a waiting execute() mustn't cancel the transition
+        return await asyncio.shield(self._next)
+
+    async def _execute(self, state):
+        while True:
+            result = await state.execute()
+            if result:
+                return result
+
+    async def _run_state(self, state):
+        executing = asyncio.create_task(self._execute(state))
+        try:
+            await asyncio.wait(
+                {executing, self._next}, return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            if not executing.done():
+                executing.cancel()
+                await asyncio.gather(executing, return_exceptions=True)
+        if self._next.done():
+            return self._next.result()
+        return executing.result()
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        state = self.states[self.initial]
+        while True:
+            self.current = state
+            self._next = self.loop.create_future()
+            try:
+                await state.start()
+                if state.name == self.terminal:
+                    # runs for one cycle
+                    await state.execute()
+                    return
+                result = await self._run_state(state)
+            finally:
+                for timer in self._timers:
+                    timer.cancel()
+                self._timers.clear()
+                self._next.cancel()
+                await state.stop()
+            state = self.states[result]
@@ -1,17 +1,37 @@
 import asyncio
-from collections import deque
 from datetime import datetime
 from enum import Enum
-import functools
-from statistics import mean
-
-from spherov2.sphero_edu import EventType
-from spherov2.sphero_edu import SpheroEduAPI
 
 from astar import a_star
-from constants import BLACK, GREEN, GRID, LIGHT_THRESHHOLD, RED, TEAL, WHITE, YELLOW
-from grid_utils import follow_path, get_random_destination
-from state import State
+from calibration import load_motion_model
+from constants import (
+    BLACK,
+    GREEN,
+    GRID,
+    LIGHT_THRESHHOLD,
+    PLANNER,
+    PLAYER_SPEED,
+    RED,
+    TEAL,
+    WHITE,
+    YELLOW,
+)
+from cost_map import CostMap
+from evasion import EvasionPlanner
+from flow_field import FlowFieldCache
+from grid_utils import (
+    MOTION_MODEL,
+    follow_path,
+    get_random_destination,
+    segment_duration,
+)
+from localization import Localizer
+from occupancy_grid import OccupancyGrid
+from path_smoothing import smooth_path
+from planner_stats import PlannerStats, StatsSummary
+from rolling_stats import RollingWindow
+from sensor_hub import SensorHub
+from state import EventState, State
 
 
 class StateName(Enum):
@@ -24,13 +44,66 @@ class StateName(Enum):
     TERMINAL = "terminal"
 
 
-class EventKey(Enum):
-    COLLISION = "collision"
-    LANDED = "landed"
+ARENA = OccupancyGrid(GRID)
+COST_MAP = CostMap(ARENA)  # keeps paths off the walls
+FLOW_FIELDS = FlowFieldCache(ARENA, cost_map=COST_MAP)
+# Plain distances for the evasion planner's timings, no cost map: the player
+# walks around the table, and the robot isn't any slower near a wall.
+DISTANCE_FIELDS = FlowFieldCache(ARENA, "euclidian")
+
+
+class Game:
+    """
+    One robot's game: where it thinks it is, where its player is, how the
+    game ended, and the localizer, sensor hub, motion model (calibration.py)
+    and evasion planner all of its states share. Every robot gets its own,
+    so any number of them can play on one loop (see fleet.py).
+    """
+
+    def __init__(self, sphero, start=(0, 0), model=None):
+        self.sphero = sphero
+        self.model = model or MOTION_MODEL
+        self.position = start
+        # Best guess at where the player is, as of player_seen. We don't track
+        # them, so it's wherever they last had their hands on the robot, walked
+        # on towards it by Evading, unless something (e.g. an overhead camera)
+        # updates it.
+        self.player_position = start
+        self.player_seen = None
+        self.lost = None
+        self.hub = SensorHub(sphero)  # started and stopped by whoever runs the game
+        self.localizer = Localizer(sphero, ARENA, self.hub, start=start)
+        self.plan_stats = StatsSummary()
+        self.evasion = EvasionPlanner(
+            ARENA,
+            robot_speed=1 / segment_duration(1, model=self.model),
+            player_speed=PLAYER_SPEED,
+            robot_fields=DISTANCE_FIELDS,
+            player_fields=DISTANCE_FIELDS,
+        )
+
+    def plan_path(self, start, goal):
+        stats = PlannerStats()
+        if PLANNER == "flow_field":
+            with stats.timed():
+                path = FLOW_FIELDS.path(start, goal, stats=stats)
+        else:
+            path = a_star(start, goal, ARENA, stats=stats, cost_map=COST_MAP)
+        self.plan_stats.add(stats)
+        return path
+
+
+GAMES = {}
 
 
-global_position = (0, 0)
-lost = None
+def game_for(sphero, toy_name=None):
+    # One per robot, shared by every state that drives it. It's made on first
+    # use, with toy_name's calibration if given, so name the toy before
+    # make_states when it isn't TOY_NAME.
+    if sphero not in GAMES:
+        model = load_motion_model(toy_name) if toy_name is not None else None
+        GAMES[sphero] = Game(sphero, model=model)
+    return GAMES[sphero]
 
 
 class Initial(State):
@@ -61,21 +134,32 @@ class Initial(State):
 
 
 class Choosing(State):
+    spin_window = 0.1  # seconds of gyro data to average
+    spin_samples = 3  # at least this many of them
+    spin_rate = 100  # degrees per second
+
     def __init__(self, sphero, name):
         super().__init__(sphero, name)
-        self.yaw_buffer = deque(
-            maxlen=5
-        )  # assuming a polling rate of 10Hz, half a second of data
+        # capacity is plenty for the window at any streaming rate we'd use
+        self.yaw_window = RollingWindow(64, seconds=Choosing.spin_window)
+        self.game = game_for(sphero)
+        self.hub = self.game.hub
 
     async def start(self):
         self.sphero.set_front_led(TEAL)  # necessary if we skip initial state
         self.sphero.set_stabilization(False)
+        self.gyroscope = self.hub.subscribe("gyroscope")
+        self.orientation = self.hub.subscribe("orientation")
 
     async def execute(self):
 
         next_state = None
         while not next_state:
-            orientation = self.sphero.get_orientation()
+            sample = await self.gyroscope.next()
+            gyro = sample.value
+            if self.orientation.latest is None:
+                continue
+            orientation = self.orientation.latest.value
             # wait for stability
             stable_pos = 10
             if (
@@ -84,65 +168,77 @@ class Choosing(State):
                 or orientation["roll"] < -stable_pos
                 or orientation["roll"] > stable_pos
             ):
-                await asyncio.sleep(0.2)
                 continue
-            gyro = self.sphero.get_gyroscope()
-            self.yaw_buffer.append(gyro["z"])
-            average = mean(self.yaw_buffer)
-            if len(self.yaw_buffer) < 5:
-                await asyncio.sleep(0.2)
+            self.yaw_window.push(gyro["z"], sample.time)
+            average = self.yaw_window.mean
+            if len(self.yaw_window) < Choosing.spin_samples:
                 continue
 
             # Spin clockwise for evading, counter clockwise for chasing
-            if average < 0 and abs(average) > 100:
+            if average < 0 and abs(average) > Choosing.spin_rate:
                 next_state = StateName.EVADING
-            if average > 0 and abs(average) > 100:
+            if average > 0 and abs(average) > Choosing.spin_rate:
                 next_state = StateName.CHASING
-
-            await asyncio.sleep(0.1)
         return next_state
 
     async def stop(self):
         self.sphero.set_stabilization(True)
-        self.yaw_buffer.clear()
+        self.hub.unsubscribe(self.gyroscope)
+        self.hub.unsubscribe(self.orientation)
+        self.yaw_window.clear()
 
 
-class Evading(State):
+class Evading(EventState):
     duration = 10  # seconds
 
     def __init__(self, sphero, name):
         super().__init__(sphero, name)
         self.tasks = []
-        self.comms_queue = asyncio.Queue()
+        self.game = game_for(sphero)
+        self.localizer = self.game.localizer
+        self.hub = self.game.hub
 
     async def path_wrapper(self):
-        global global_position
+        game = self.game
         while self.running:
-            dest = get_random_destination(GRID, global_position)
-            path = a_star(global_position, dest, GRID)
-            await follow_path(self.sphero, path)
-            global_position = path[-1]
-
-    def check_light_sensor(self):
-        return self.sphero.get_luminosity()["ambient_light"]
+            game.position = self.localizer.cell()
+            now = asyncio.get_running_loop().time()  # so it also works on virtual time
+            # they'll have come after it since we last looked
+            game.player_position = game.evasion.chase(
+                game.player_position, game.position, now - game.player_seen
+            )
+            game.player_seen = now
+            dest = game.evasion.choose(game.position, game.player_position, now)
+            path = game.plan_path(game.position, dest) if dest is not None else False
+            if not path or len(path) < 2:
+                # already in the safest spot (or boxed in), look again later
+                await asyncio.sleep(game.evasion.period)
+                continue
+            # Only drive the first leg, the best place to be will have moved by
+            # then. No pause after it, the next leg follows straight on.
+            leg = smooth_path(path, ARENA, COST_MAP)[:2]
+            game.position = await follow_path(
+                self.sphero, leg, localizer=self.localizer, pause=0, model=game.model
+            )
 
     async def check_light_wrapper(self):
-        loop = asyncio.get_running_loop()
         while self.running:
-            try:
-                light_result = await loop.run_in_executor(None, self.check_light_sensor)
-                await self.comms_queue.put(light_result)
-            except Exception as e:
-                print("check_light_wrapper error:", e)
-            await asyncio.sleep(0.2)
+            light_result = (await self.luminosity.next()).value
+            if light_result >= LIGHT_THRESHHOLD:
+                self.transition(StateName.CAUGHT)
 
     async def start(self):
-        global global_position
         print("entering EVADE")
+        self.game.player_position = self.game.position  # they just let go of it
+        self.game.player_seen = asyncio.get_running_loop().time()
         self.sphero.set_heading(0)
-        self.start_time = datetime.now()
         self.running = True
         self.sphero.set_main_led(GREEN)
+        # it's been carried around, trust our last estimate over the odometry
+        self.localizer.reset(self.game.position)
+        self.localizer.start()
+        self.luminosity = self.hub.subscribe("luminosity")
+        self.call_later(Evading.duration, StateName.TIMED_OUT)
 
         light_task = asyncio.create_task(self.check_light_wrapper())
         path_task = asyncio.create_task(self.path_wrapper())
@@ -150,77 +246,61 @@ class Evading(State):
         self.tasks.append(light_task)
         self.tasks.append(path_task)
 
-    async def execute(self):
-        try:
-            while self.running:
-                if (
-                    datetime.now() - self.start_time
-                ).total_seconds() < Evading.duration:
-                    await asyncio.sleep(0.1)
-                    # nested try catch, gross
-                    try:
-                        light_result = self.comms_queue.get_nowait()
-                    except:
-                        light_result = None
-                    if light_result is None:
-                        continue
-                    if light_result >= LIGHT_THRESHHOLD:
-                        return StateName.CAUGHT
-                else:
-                    return StateName.TIMED_OUT
-        except asyncio.CancelledError:
-            pass  # allow clean exit
-
     async def stop(self):
         self.sphero.set_speed(0)
         self.sphero.set_main_led(BLACK)
         self.running = False
         for task in self.tasks:
             task.cancel()
+        self.tasks.clear()
+        self.hub.unsubscribe(self.luminosity)
+        self.localizer.stop()
+        print("planner:", self.game.plan_stats.format())
 
 
-class Chasing(State):
+class Chasing(EventState):
     duration = 10  # seconds
 
     def __init__(self, sphero, name):
         super().__init__(sphero, name)
         self.tasks = []
-        self.comms_queue = asyncio.Queue()
+        self.game = game_for(sphero)
+        self.localizer = self.game.localizer
+        self.hub = self.game.hub
 
     async def path_wrapper(self):
-        global global_position
-
+        game = self.game
         while self.running:
-            dest = None
-            path = None
-            # Some destinations might be unreachable. A* returns False in that case.
-            # Keep trying until we have a valid destination.
-            while not path:
-                dest = get_random_destination(GRID, global_position)
-                path = a_star(global_position, dest, GRID)
-            await follow_path(self.sphero, path)
-            global_position = path[-1]
-
-    def check_light_sensor(self):
-        return self.sphero.get_luminosity()["ambient_light"]
+            game.position = self.localizer.cell()
+            # Destinations are only sampled from our own connected component,
+            # so there's always a path and no need to retry.
+            dest = get_random_destination(ARENA, game.position)
+            path = game.plan_path(game.position, dest) if dest is not None else False
+            if not path:
+                await asyncio.sleep(0.5)
+                continue
+            game.position = await follow_path(
+                self.sphero,
+                smooth_path(path, ARENA, COST_MAP),
+                localizer=self.localizer,
+                model=game.model,
+            )
 
     async def check_light_wrapper(self):
-        loop = asyncio.get_running_loop()
         while self.running:
-            try:
-                light_result = await loop.run_in_executor(None, self.check_light_sensor)
-
-                await self.comms_queue.put(light_result)
-            except Exception as e:
-                print("check_light_wrapper error:", e)
-            await asyncio.sleep(0.2)
+            light_result = (await self.luminosity.next()).value
+            # lose condition, unless the timer beat us to it
+            if light_result >= LIGHT_THRESHHOLD and self.transition(StateName.TERMINAL):
+                self.game.lost = True
 
     async def start(self):
-        global global_position
-        print("entering CHASING", global_position)
-        self.start_time = datetime.now()
+        print("entering CHASING", self.game.position)
         self.running = True
         self.sphero.set_main_led(RED)
+        self.localizer.reset(self.game.position)
+        self.localizer.start()
+        self.luminosity = self.hub.subscribe("luminosity")
+        self.call_later(Chasing.duration, StateName.TIMED_OUT)
 
         light_task = asyncio.create_task(self.check_light_wrapper())
         path_task = asyncio.create_task(self.path_wrapper())
@@ -228,72 +308,51 @@ class Chasing(State):
         self.tasks.append(light_task)
         self.tasks.append(path_task)
 
-    async def execute(self):
-        global lost, global_position
-        try:
-            while self.running:
-                if (
-                    datetime.now() - self.start_time
-                ).total_seconds() < Chasing.duration:
-                    await asyncio.sleep(0.1)
-                    # nested try catch, gross
-                    try:
-                        light_result = self.comms_queue.get_nowait()
-                    except:
-                        light_result = None
-                    if light_result is None:
-                        continue
-
-                    if light_result >= LIGHT_THRESHHOLD:
-                        lost = True
-                        return StateName.TERMINAL  # lose condition
-                else:
-                    return StateName.TIMED_OUT
-        except asyncio.CancelledError:
-            pass  # allow clean exit
-
     async def stop(self):
         self.sphero.set_speed(0)
         self.sphero.set_main_led(BLACK)
         self.running = False
         for task in self.tasks:
             task.cancel()
+        self.tasks.clear()
+        self.hub.unsubscribe(self.luminosity)
+        self.localizer.stop()
+        print("planner:", self.game.plan_stats.format())
 
 
-class Caught(State):
+class Caught(EventState):
+    # Collision events are noisy and landings are hard to trigger. A tap only
+    # counts if no landing shows up this soon after it.
+    tap_grace = 0.1  # seconds
+
     def __init__(self, sphero, name):
         super().__init__(sphero, name)
-        self.comms_queue = asyncio.Queue()
-        self.tasks = []
-
-    def flush_queue(self):
-        while not self.comms_queue.empty():
-            self.comms_queue.get_nowait()
-
-    async def write_event(self, type):
-        await self.comms_queue.put(type)
-
-    def on_event(self, loop, type, _):
-        event_write_task = loop.create_task(self.write_event(type))
-        self.tasks.append(event_write_task)
+        self.listening = False
+        self.tap_timer = None
+        self.game = game_for(sphero)
+        events = self.game.hub.events
+        events.on("collision", self.on_collision)
+        events.on("landing", self.on_landing)
+
+    def on_tap(self):
+        self.tap_timer = None
+        if self.transition(StateName.TERMINAL):
+            self.game.lost = False
+
+    def on_collision(self, key, count, first, last):
+        if self.listening and self.tap_timer is None:
+            self.tap_timer = self.machine.loop.call_later(Caught.tap_grace, self.on_tap)
+
+    def on_landing(self, key, count, first, last):
+        if self.listening:
+            self.transition(StateName.CHOOSING)
 
     async def start(self):
         print("entering CAUGHT")
-        self.flush_queue()
-        loop = asyncio.get_running_loop()
         self.sphero.set_main_led(YELLOW)
         await asyncio.sleep(1)
 
-        SpheroEduAPI.register_event(
-            self.sphero,
-            EventType.on_collision,
-            functools.partial(self.on_event, loop, EventKey.COLLISION),
-        )
-        SpheroEduAPI.register_event(
-            self.sphero,
-            EventType.on_landing,
-            functools.partial(self.on_event, loop, EventKey.LANDED),
-        )
+        self.listening = True
         self.sphero.scroll_matrix_text("You caught me!", WHITE, 30, True)
         await asyncio.sleep(2)
         self.sphero.scroll_matrix_text(
@@ -301,69 +360,46 @@ class Caught(State):
         )
         await asyncio.sleep(4)
 
-    async def execute(self):
-        global lost
-        signals = []
-        try:
-            signals = []
-            while not self.comms_queue.empty():
-                signal = self.comms_queue.get_nowait()
-                if signal:
-                    signals.append(signal)
-        except:
-            print("exception")
-
-        # Collision events are noisy and landings are hard to trigger.
-        # Dump the whole queue and sort through the results to prioritize landings.
-        if EventKey.LANDED in signals:
-            return StateName.CHOOSING
-        elif EventKey.COLLISION in signals:
-            lost = False
-            return StateName.TERMINAL
-
-        await asyncio.sleep(0.1)
-
     async def stop(self):
-        for task in self.tasks:
-            task.cancel()
-        self.flush_queue()
+        self.listening = False
+        if self.tap_timer is not None:
+            self.tap_timer.cancel()
+            self.tap_timer = None
 
 
-class TimedOut(State):
+class TimedOut(EventState):
+    tap_grace = 0.1  # seconds, see Caught
+
     def __init__(self, sphero, name):
         super().__init__(sphero, name)
-        self.comms_queue = asyncio.Queue()
-        self.tasks = []
-
-    def flush_queue(self):
-        while not self.comms_queue.empty():
-            self.comms_queue.get_nowait()
-
-    async def write_event(self, type):
-        await self.comms_queue.put(type)
-
-    def on_event(self, loop, type, _):
-        event_write_task = loop.create_task(self.write_event(type))
-        self.tasks.append(event_write_task)
+        self.listening = False
+        self.tap_timer = None
+        self.game = game_for(sphero)
+        events = self.game.hub.events
+        events.on("collision", self.on_collision)
+        events.on("landing", self.on_landing)
+
+    def on_tap(self):
+        self.tap_timer = None
+        if self.transition(StateName.TERMINAL):
+            self.game.lost = False
+
+    def on_collision(self, key, count, first, last):
+        if self.listening and self.tap_timer is None:
+            self.tap_timer = self.machine.loop.call_later(
+                TimedOut.tap_grace, self.on_tap
+            )
+
+    def on_landing(self, key, count, first, last):
+        if self.listening:
+            self.transition(StateName.CHOOSING)
 
     async def start(self):
         print("entering TIMED_OUT")
-        self.flush_queue()
-        loop = asyncio.get_running_loop()
         self.sphero.set_main_led(YELLOW)
         await asyncio.sleep(1)
 
-        SpheroEduAPI.register_event(
-            self.sphero,
-            EventType.on_collision,
-            functools.partial(self.on_event, loop, EventKey.COLLISION),
-        )
-        SpheroEduAPI.register_event(
-            self.sphero,
-            EventType.on_landing,
-            functools.partial(self.on_event, loop, EventKey.LANDED),
-        )
-
+        self.listening = True
         self.sphero.spin(720, 2)
         await asyncio.sleep(1)
         self.sphero.scroll_matrix_text(
@@ -371,48 +407,28 @@ class TimedOut(State):
         )
         await asyncio.sleep(1)
 
-    async def execute(self):
-        global lost
-        # Collision events are noisy and landings are hard to trigger.
-        # Dump the whole queue and sort through the results to prioritize landings.
-        try:
-            signals = []
-            while not self.comms_queue.empty():
-                signal = self.comms_queue.get_nowait()
-                if signal:
-                    signals.append(signal)
-        except:
-            print("exception")
-
-        print(signals)
-        if EventKey.LANDED in signals:
-            return StateName.CHOOSING
-        elif EventKey.COLLISION in signals:
-            lost = False
-            return StateName.TERMINAL
-
-        await asyncio.sleep(0.1)
-
     async def stop(self):
         self.sphero.set_speed(0)
-        for task in self.tasks:
-            task.cancel()
-        self.flush_queue()
+        self.listening = False
+        if self.tap_timer is not None:
+            self.tap_timer.cancel()
+            self.tap_timer = None
 
 
 class Terminal(State):
     def __init__(self, sphero, name):
         super().__init__(sphero, name)
         self.start_time = 0
+        self.game = game_for(sphero)
 
     async def start(self):
         self.start_time = datetime.now()
 
     async def execute(self):
-        if lost is None:
+        if self.game.lost is None:
             self.sphero.set_main_led(WHITE)
             print("Tie game! (how did you get here?)")
-        elif lost:
+        elif self.game.lost:
             self.sphero.set_main_led(RED)
             print("Loserrrrr")
         else:
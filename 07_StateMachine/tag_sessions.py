@@ -0,0 +1,156 @@
+"""
+Plays whole tag games on virtual time, a simulated robot against a random
+player, for timing regression checks.
+
+    python tag_sessions.py                       # 200 games
+    python tag_sessions.py --games 2000 --latency 0.05 --seed 3
+    python tag_sessions.py --games 1 --verbose   # watch one game's log
+"""
+
+import argparse
+import asyncio
+from collections import Counter
+import contextlib
+import io
+import random
+import time
+
+import numpy as np
+
+from constants import TOY_NAME
+from main import make_states
+from sim_sphero import SimulatedSpheroEduAPI, SimulationConfig, find_toy
+from state_machine import StateMachine
+from states import GAMES, StateName, game_for
+import virtual_time
+
+MAX_GAME_SECONDS = 600  # virtual, a game where nobody ever taps could go on forever
+
+
+class RandomPlayer:
+    """
+    Does something plausible, at a random time, in every state: spins the
+    robot to pick a side, sometimes grabs it before it times out, then
+    taps or tosses it. Keeps retrying until the state changes.
+    """
+
+    def __init__(self, sphero, machine, rng, poll=0.05):
+        self.sphero = sphero
+        self.machine = machine
+        self.rng = rng
+        self.poll = poll
+        self.visited = []
+
+    async def act(self, name):
+        rng = self.rng
+        while True:
+            match name:
+                case StateName.CHOOSING:
+                    await asyncio.sleep(rng.uniform(0.5, 3))
+                    self.sphero.twist(rng.choice((-400, 400)), 1.0)
+                case StateName.EVADING | StateName.CHASING:
+                    # anything past the state's 10 s is a time out
+                    await asyncio.sleep(rng.uniform(1, 14))
+                    self.sphero.cover_light(0.5)
+                case StateName.CAUGHT | StateName.TIMED_OUT:
+                    await asyncio.sleep(rng.uniform(1, 10))
+                    if rng.random() < 0.3:
+                        self.sphero.toss()
+                    else:
+                        self.sphero.tap()
+                case _:
+                    return
+
+    async def run(self):
+        current = None
+        action = None
+        try:
+            while True:
+                state = self.machine.current
+                if state is not None and state.name != current:
+                    current = state.name
+                    self.visited.append(current)
+                    if action is not None:
+                        action.cancel()
+                    action = asyncio.create_task(self.act(current))
+                await asyncio.sleep(self.poll)
+        finally:
+            if action is not None:
+                action.cancel()
+
+
+def play(seed, latency=0.03):
+    clock = virtual_time.VirtualClock()
+    config = SimulationConfig(
+        latency=latency, clock=clock, seed=seed, threaded_events=False
+    )
+    sphero = SimulatedSpheroEduAPI(find_toy(TOY_NAME, config))
+    game = game_for(sphero)  # a new robot, so a fresh game
+    machine = StateMachine(make_states(sphero), StateName.CHOOSING, StateName.TERMINAL)
+    player = RandomPlayer(sphero, machine, random.Random(seed))
+
+    async def session():
+        game.hub.start()
+        playing = asyncio.create_task(player.run())
+        try:
+            await asyncio.wait_for(machine.run(), MAX_GAME_SECONDS)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            playing.cancel()
+            game.hub.stop()
+
+    t0 = time.perf_counter()
+    finished = virtual_time.run(session(), clock)
+    GAMES.pop(sphero)  # done with this robot
+    outcome = (
+        {None: "tie", True: "lost", False: "won"}[game.lost]
+        if finished
+        else "unfinished"
+    )
+    return {
+        "seed": seed,
+        "outcome": outcome,
+        "virtual_s": clock.now,
+        "wall_s": time.perf_counter() - t0,
+        "states": len(player.visited),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated tag games on virtual time")
+    parser.add_argument("--games", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.03)
+    parser.add_argument(
+        "--verbose", action="store_true", help="show the games' own output"
+    )
+    args = parser.parse_args()
+
+    results = []
+    for game in range(args.games):
+        log = (
+            contextlib.nullcontext()
+            if args.verbose
+            else contextlib.redirect_stdout(io.StringIO())
+        )
+        with log:
+            results.append(play(args.seed + game, args.latency))
+
+    virtual = np.array([r["virtual_s"] for r in results])
+    wall = np.array([r["wall_s"] for r in results])
+    print(f"{len(results)} games: {dict(Counter(r['outcome'] for r in results))}")
+    print(
+        f"game length {np.mean(virtual):.1f} s mean, "
+        f"{np.percentile(virtual, 50):.1f} p50, {np.percentile(virtual, 90):.1f} p90, "
+        f"{np.mean([r['states'] for r in results]):.1f} states"
+    )
+    print(
+        f"wall time {np.mean(wall) * 1000:.1f} ms per game, {wall.sum():.2f} s total, "
+        f"{virtual.sum() / wall.sum():.0f}x real time"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import random
+import time
+
+import numpy as np
+
+from cost_map import CostMap
+from occupancy_grid import OccupancyGrid
+
+
+def test_update_cells_matches_a_rebuild():
+    rng = random.Random(13)
+    for _ in range(30):
+        width, height = rng.randrange(3, 25), rng.randrange(3, 25)
+        noise = np.random.default_rng(rng.randrange(2**32)).random((height, width))
+        grid = OccupancyGrid((noise < 0.3).astype(np.uint8))
+        cost_map = CostMap(grid, penalty_radius=rng.choice((0.5, 1.5, 2.0, 3.0)))
+        for _ in range(10):
+            cells = [
+                (rng.randrange(width), rng.randrange(height))
+                for _ in range(rng.randrange(1, 4))
+            ]
+            grid.set_cells(cells, rng.choice((0, 1)))
+            cost_map.update_cells(cells)
+            rebuilt = CostMap(grid, penalty_radius=cost_map.penalty_radius)
+            assert np.array_equal(cost_map.distances, rebuilt.distances)
+            assert cost_map.cell_costs == rebuilt.cell_costs
+
+
+def test_one_cell_update_only_touches_its_window():
+    noise = np.random.default_rng(0).random((512, 512))
+    grid = OccupancyGrid((noise < 0.2).astype(np.uint8))
+    t0 = time.perf_counter()
+    cost_map = CostMap(grid)
+    rebuild = time.perf_counter() - t0
+
+    updates = []
+    for x in (100, 200, 300):
+        grid.set_cells([(x, x)], 1)
+        t0 = time.perf_counter()
+        cost_map.update_cells([(x, x)])
+        updates.append(time.perf_counter() - t0)
+    # a few hundred cells against a quarter million, whole-grid work in
+    # there would put it within a few times the rebuild
+    assert min(updates) < rebuild / 20
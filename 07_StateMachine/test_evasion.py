@@ -0,0 +1,45 @@
+import math
+
+import numpy as np
+
+from constants import GRID, PLAYER_SPEED
+from evasion import EvasionPlanner
+from occupancy_grid import OccupancyGrid
+
+ARENA = OccupancyGrid.from_grid(GRID)
+ROBOT_SPEED = 1.6  # cells per second, slower than the player
+
+
+def planner(grid=ARENA):
+    return EvasionPlanner(grid, robot_speed=ROBOT_SPEED, player_speed=PLAYER_SPEED)
+
+
+def test_moves_away_from_a_nearby_player():
+    evasion = planner()
+    # the last one is right after they let go of it, when nowhere is safe
+    pairs = (((2, 2), (2, 3)), ((4, 3), (3, 3)), ((0, 3), (0, 2)), ((4, 4), (4, 4)))
+    for robot, player in pairs:
+        choice = evasion.choose(robot, player, now=0)
+        assert choice is not None and choice != robot
+        assert math.dist(choice, player) > math.dist(robot, player) + 1
+
+
+def test_takes_the_safe_cell_furthest_from_the_player():
+    # a long corridor, the player slow enough that everything ahead is safe
+    evasion = EvasionPlanner(
+        np.zeros((1, 20), dtype=np.uint8), robot_speed=2, player_speed=1
+    )
+    assert evasion.choose((5, 0), (3, 0), now=0) == (19, 0)
+
+
+def test_boxed_in_robot_has_nowhere_to_go():
+    cells = np.ones((3, 3), dtype=np.uint8)
+    cells[1, 1] = 0
+    assert planner(OccupancyGrid(cells)).choose((1, 1), (0, 0), now=0) == (1, 1)
+
+
+def test_player_estimate_closes_in_on_the_robot():
+    evasion = planner()
+    assert evasion.chase((0, 0), (0, 5), 0) == (0, 0)
+    assert evasion.chase((0, 0), (0, 5), 1.0) == (0, 2)
+    assert evasion.chase((0, 0), (0, 5), 10) == (0, 5)
@@ -0,0 +1,47 @@
+import random
+
+import numpy as np
+
+from astar import a_star
+from hpa import HierarchicalPlanner
+from occupancy_grid import OccupancyGrid
+
+
+def test_corner_crossing_rebuilt_when_side_cell_changes():
+    cells = np.ones((4, 4), dtype=np.uint8)
+    for x, y in ((0, 0), (1, 1), (2, 2), (3, 3), (2, 1)):
+        cells[y, x] = 0
+    grid = OccupancyGrid(cells)
+    planner = HierarchicalPlanner(grid, cluster_size=2)
+
+    grid.set_cells([(2, 1)], 1)
+    planner.update_cells([(2, 1)])
+
+    expected = [(0, 0), (1, 1), (2, 2), (3, 3)]
+    assert a_star((0, 0), (3, 3), grid) == expected
+    assert HierarchicalPlanner(grid, cluster_size=2).plan((0, 0), (3, 3)) == expected
+    assert planner.plan((0, 0), (3, 3)) == expected
+
+
+def test_same_reachability_as_a_star_after_random_edits():
+    rng = random.Random(8)
+    for _ in range(20):
+        size = rng.randrange(6, 20)
+        noise = np.random.default_rng(rng.randrange(2**32)).random((size, size))
+        grid = OccupancyGrid((noise < 0.35).astype(np.uint8))
+        planner = HierarchicalPlanner(grid, cluster_size=rng.choice((2, 3, 4)))
+        for _ in range(10):
+            cells = [
+                (rng.randrange(size), rng.randrange(size))
+                for _ in range(rng.randrange(1, 4))
+            ]
+            grid.set_cells(cells, rng.choice((0, 1)))
+            planner.update_cells(cells)
+            free = [grid.node_at(int(n)) for n in grid.free_ids()]
+            for _ in range(5):
+                start, goal = rng.choice(free), rng.choice(free)
+                path = planner.plan(start, goal)
+                assert bool(path) == bool(a_star(start, goal, grid)), (start, goal)
+                if path:
+                    assert path[0] == start and path[-1] == goal
+                    assert all(b in grid.neighbors(a) for a, b in zip(path, path[1:]))
@@ -0,0 +1,85 @@
+import asyncio
+import math
+
+import pytest
+from spherov2.sphero_edu import EventType
+
+import virtual_time
+from astar import a_star
+from constants import GRID
+from cost_map import CostMap
+from grid_utils import PathExecutor, follow_path
+from localization import Localizer
+from occupancy_grid import OccupancyGrid
+from path_smoothing import smooth_path
+from sensor_hub import SensorHub
+from sim_sphero import SimulatedSpheroEduAPI, SimulationConfig, find_toy
+
+ARENA = OccupancyGrid.from_grid(GRID)
+COST_MAP = CostMap(ARENA)  # as the game plans, off the walls
+
+
+def drive(path, closed_loop, seed=0, replan=None):
+    """
+    Runs path on the simulator, returns where it stopped, the collisions
+    and how long it took.
+    """
+    clock = virtual_time.VirtualClock()
+    config = SimulationConfig(
+        start=path[0], latency=0.03, clock=clock, seed=seed, threaded_events=False
+    )
+    api = SimulatedSpheroEduAPI(find_toy("SB-TEST", config))
+    collisions = []
+    api.register_event(EventType.on_collision, lambda _api: collisions.append(1))
+    hub = SensorHub(api)
+    localizer = Localizer(api, ARENA, hub, start=path[0]) if closed_loop else None
+
+    async def main():
+        hub.start()
+        if localizer is not None:
+            localizer.start()
+        try:
+            if replan is None:
+                driving = follow_path(api, path, localizer=localizer, pause=0)
+            else:
+                executor = PathExecutor(api, localizer=localizer)
+                driving = executor.run(path, replan)
+            await asyncio.wait_for(driving, 30)
+            took = clock.now
+            await asyncio.sleep(1.5)  # coast to a standstill
+        finally:
+            if localizer is not None:
+                localizer.stop()
+            hub.stop()
+
+        return took
+
+    took = virtual_time.run(main(), clock)
+    return api.cell_position(), len(collisions), took
+
+
+@pytest.mark.parametrize("closed_loop", [False, True])
+@pytest.mark.parametrize("smooth", [False, True])
+@pytest.mark.parametrize("goal", [(5, 5), (5, 0), (0, 5), (3, 5), (4, 2)])
+def test_reaches_the_goal_without_a_collision(goal, smooth, closed_loop):
+    path = a_star((0, 0), goal, ARENA, cost_map=COST_MAP)
+    if smooth:
+        path = smooth_path(path, ARENA, COST_MAP)
+    position, collisions, _took = drive(path, closed_loop)
+    assert collisions == 0
+    assert math.dist(position, goal) < 0.5
+
+
+def test_gives_up_on_a_segment_into_a_wall_and_replans():
+    replanned = []
+
+    def replan(location):
+        replanned.append(location)
+        return None
+
+    # straight through the blocked (1, 1)
+    position, collisions, took = drive([(1, 0), (1, 3)], True, replan=replan)
+    assert collisions
+    assert replanned[-1] == (1, 0)  # after the one for (1, 3)
+    assert math.dist(position, (1, 0)) < 0.7
+    assert took < 5
@@ -0,0 +1,93 @@
+"""
+Virtual time for asyncio.
+
+On a VirtualTimeEventLoop, whenever nothing is ready to run the clock jumps
+straight to the next timer instead of waiting for it, so sleeps cost
+nothing and a 10 second behaviour finishes as fast as its callbacks can
+run. Pair it with the simulated Sphero on the same VirtualClock and whole
+games run in milliseconds.
+
+Work on other threads (run_in_executor, sphero listeners) doesn't hold the
+clock back, it just lands whenever it's done. Keep anything that should be
+deterministic on the loop.
+"""
+
+import asyncio
+import selectors
+
+
+class VirtualClock:
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        # a blocking call on the loop thread, the loop's time moves on with it
+        if seconds > 0:
+            self.now += seconds
+
+
+class VirtualTimeSelector(selectors.BaseSelector):
+    """
+    Polls the real selector without blocking, and if nothing came in
+    pretends to have waited the full timeout.
+    """
+
+    def __init__(self, clock, selector=None):
+        self.clock = clock
+        self.selector = selector or selectors.DefaultSelector()
+
+    def register(self, fileobj, events, data=None):
+        return self.selector.register(fileobj, events, data)
+
+    def unregister(self, fileobj):
+        return self.selector.unregister(fileobj)
+
+    def modify(self, fileobj, events, data=None):
+        return self.selector.modify(fileobj, events, data)
+
+    def get_map(self):
+        return self.selector.get_map()
+
+    def close(self):
+        self.selector.close()
+
+    def select(self, timeout=None):
+        events = self.selector.select(0)
+        if events or timeout == 0:
+            return events
+        if timeout is None:
+            # no timers, only another thread can wake us, so really wait
+            return self.selector.select(None)
+        self.clock.now += timeout
+        return events
+
+
+class VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+    virtual_time = True
+
+    def __init__(self, clock=None):
+        self.clock = clock or VirtualClock()
+        super().__init__(VirtualTimeSelector(self.clock))
+
+    def time(self):
+        return self.clock.now
+
+
+class VirtualTimePolicy(asyncio.DefaultEventLoopPolicy):
+    """Makes asyncio.run (and everything else) use virtual time loops on clock."""
+
+    def __init__(self, clock=None):
+        super().__init__()
+        self.clock = clock or VirtualClock()
+
+    def new_event_loop(self):
+        return VirtualTimeEventLoop(self.clock)
+
+
+def run(main, clock=None):
+    """asyncio.run on a virtual time loop."""
+    with asyncio.Runner(loop_factory=lambda: VirtualTimeEventLoop(clock)) as runner:
+        return runner.run(main)